@@ -0,0 +1,100 @@
+"""
+Adaptive concurrency limiting for LLM requests (AIMD).
+
+AIMDLimiter bounds the number of requests in flight and moves that bound
+with what the server reports back, the way TCP congestion control does:
+every request that completes under the target latency raises the limit by
+about one per round of requests (additive increase), and a request that
+times out or is rejected as overloaded (429/503) cuts it by a factor
+(multiplicative decrease). The limit therefore settles just below the
+point where the server starts queueing, without manual tuning.
+
+A burst of failures caused by one overload counts as a single decrease:
+requests that were sent before the last cut are not allowed to cut again.
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Optional
+
+OK = "ok"
+OVERLOAD = "overload"
+
+
+class AIMDLimiter:
+    """Concurrency limit with additive increase and multiplicative decrease."""
+
+    def __init__(
+        self,
+        initial: int,
+        minimum: int = 1,
+        maximum: int = 16,
+        target_latency: float = 30.0,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+        log: Callable[[str], None] = print,
+    ):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(self.maximum, max(self.minimum, initial)))
+        self.target_latency = target_latency
+        self.increase = increase
+        self.decrease = decrease
+        self.log = log
+        self.inflight = 0
+        self.decreases = 0
+        self.peak = int(self.limit)
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+        self._queue: Deque[object] = deque()
+
+    def acquire(self, cancelled: Optional[Callable[[], bool]] = None) -> Optional[float]:
+        """
+        Block until a request may be sent and return its start time, or None
+        if `cancelled()` became true while waiting. Waiters are admitted in
+        arrival order, so callers that queue work by priority keep it.
+        """
+        ticket = object()
+        with self._cond:
+            self._queue.append(ticket)
+            try:
+                while self._queue[0] is not ticket or self.inflight >= int(self.limit):
+                    if cancelled is not None and cancelled():
+                        return None
+                    self._cond.wait(0.1)
+            finally:
+                self._queue.remove(ticket)
+                self._cond.notify_all()
+            self.inflight += 1
+            return time.monotonic()
+
+    def release(self, started: float, outcome: str = OK) -> None:
+        """
+        Finish a request sent at `started` (from acquire) and adjust the
+        limit: OK below the target latency increases it, OVERLOAD cuts it.
+        Other failures leave it unchanged.
+        """
+        latency = time.monotonic() - started
+        with self._cond:
+            self.inflight -= 1
+            before = int(self.limit)
+            if outcome == OVERLOAD:
+                if started >= self._last_decrease:
+                    self.limit = max(float(self.minimum), self.limit * self.decrease)
+                    self._last_decrease = time.monotonic()
+                    self.decreases += 1
+                    self.log(
+                        f"Adaptive concurrency: overload after {latency:.1f}s, "
+                        f"limit {before} -> {int(self.limit)}"
+                    )
+            elif outcome == OK and latency <= self.target_latency:
+                # About +increase per limit's worth of completed requests
+                self.limit = min(float(self.maximum), self.limit + self.increase / self.limit)
+                if int(self.limit) > before:
+                    self.log(
+                        f"Adaptive concurrency: latency {latency:.1f}s under "
+                        f"{self.target_latency:g}s target, limit {before} -> {int(self.limit)}"
+                    )
+            self.peak = max(self.peak, int(self.limit))
+            self._cond.notify_all()
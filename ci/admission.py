@@ -0,0 +1,137 @@
+"""
+Host-wide admission control for requests to the shared LLM server.
+
+Every llm_review.py process on an agent consults the same SQLite database
+before sending a request. Admission needs both a free slot (at most
+`max_inflight` requests across all processes) and enough tokens in a token
+bucket that refills at `tokens_per_second` up to `burst`, where a request
+costs its estimated prompt tokens (a rate of 0 disables the bucket). Waiting requests are queued by priority
+(0 = main branch, 1 = everything else) and then by arrival, so main-branch
+builds are admitted first when the server is busy.
+
+Slots are leases tied to a process ID, so a build that crashes mid-request
+does not leak capacity: leases of dead processes are reclaimed.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Callable, Optional
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS bucket (id INTEGER PRIMARY KEY CHECK (id = 0), tokens REAL, updated REAL);
+CREATE TABLE IF NOT EXISTS leases (id TEXT PRIMARY KEY, pid INTEGER, acquired REAL);
+CREATE TABLE IF NOT EXISTS waiters (id TEXT PRIMARY KEY, pid INTEGER, priority INTEGER, since REAL);
+"""
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class AdmissionController:
+    """Token bucket plus concurrency limit shared through a SQLite file."""
+
+    def __init__(
+        self,
+        db_path: str,
+        tokens_per_second: float,
+        burst: float,
+        max_inflight: int,
+        poll_interval: float = 0.2,
+    ):
+        self.db_path = db_path
+        self.rate = tokens_per_second
+        self.burst = burst
+        self.max_inflight = max_inflight
+        self.poll_interval = poll_interval
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        with self._connect() as db:
+            db.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            self._local.db = db
+        return db
+
+    def _reap(self, db: sqlite3.Connection) -> None:
+        """Drop leases and queue entries of processes that no longer exist."""
+        for table in ("leases", "waiters"):
+            for row_id, pid in db.execute(f"SELECT id, pid FROM {table}").fetchall():
+                if not _pid_alive(pid):
+                    db.execute(f"DELETE FROM {table} WHERE id = ?", (row_id,))
+
+    def _try_admit(self, db: sqlite3.Connection, waiter_id: str, priority: int, since: float, cost: float) -> bool:
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            self._reap(db)
+            now = time.time()
+            row = db.execute("SELECT tokens, updated FROM bucket WHERE id = 0").fetchone()
+            tokens = self.burst if row is None else min(self.burst, row[0] + (now - row[1]) * self.rate)
+
+            ahead = db.execute(
+                "SELECT COUNT(*) FROM waiters WHERE id != ? AND (priority < ? OR (priority = ? AND since < ?))",
+                (waiter_id, priority, priority, since),
+            ).fetchone()[0]
+            inflight = db.execute("SELECT COUNT(*) FROM leases").fetchone()[0]
+            # A request larger than the whole bucket is admitted once it is full
+            needed = min(cost, self.burst)
+
+            has_tokens = self.rate <= 0 or tokens >= needed
+            admitted = ahead == 0 and inflight < self.max_inflight and has_tokens
+            if admitted:
+                if self.rate > 0:
+                    tokens -= needed
+                db.execute("DELETE FROM waiters WHERE id = ?", (waiter_id,))
+                db.execute(
+                    "INSERT INTO leases (id, pid, acquired) VALUES (?, ?, ?)",
+                    (waiter_id, os.getpid(), now),
+                )
+            db.execute("INSERT OR REPLACE INTO bucket (id, tokens, updated) VALUES (0, ?, ?)", (tokens, now))
+            db.execute("COMMIT")
+            return admitted
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    def acquire(
+        self,
+        cost: float,
+        priority: int = 1,
+        cancelled: Optional[Callable[[], bool]] = None,
+    ) -> Optional[str]:
+        """
+        Block until a request of `cost` tokens is admitted and return its
+        lease ID, or None if `cancelled()` became true while waiting.
+        """
+        db = self._connect()
+        waiter_id = uuid.uuid4().hex
+        since = time.time()
+        db.execute(
+            "INSERT INTO waiters (id, pid, priority, since) VALUES (?, ?, ?, ?)",
+            (waiter_id, os.getpid(), priority, since),
+        )
+        try:
+            while not self._try_admit(db, waiter_id, priority, since, cost):
+                if cancelled is not None and cancelled():
+                    return None
+                time.sleep(self.poll_interval)
+            return waiter_id
+        finally:
+            db.execute("DELETE FROM waiters WHERE id = ?", (waiter_id,))
+
+    def release(self, lease_id: str) -> None:
+        """Give back the concurrency slot held by lease_id."""
+        self._connect().execute("DELETE FROM leases WHERE id = ?", (lease_id,))
@@ -0,0 +1,116 @@
+"""
+Client-side load balancing across several LLM server replicas.
+
+LoadBalancer picks the endpoint with the lowest expected wait: its
+outstanding requests (plus the new one) times its smoothed latency, so a
+fast replica takes more of the load than a slow one and a replica that is
+busy with a long prefill is avoided. Health is checked passively from the
+requests themselves: a replica that fails several requests in a row is
+ejected for a while (longer each time it is ejected again), then comes
+back with a weight that ramps up over a slow-start period, so it is not
+flooded the moment it returns.
+"""
+
+import threading
+import time
+from typing import Callable, Iterable, List, Optional
+
+
+class Endpoint:
+    """Health and load state of one replica."""
+
+    def __init__(self, url: str, initial_latency: float):
+        self.url = url
+        self.outstanding = 0
+        self.latency = initial_latency
+        self.failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self.returned_at = 0.0
+        self.requests = 0
+
+    def weight(self, now: float, slow_start: float) -> float:
+        """Share of a healthy replica's load this one should take (0.1 to 1)."""
+        if slow_start <= 0 or not self.returned_at:
+            return 1.0
+        return min(1.0, max(0.1, (now - self.returned_at) / slow_start))
+
+
+class LoadBalancer:
+    """Least-outstanding, latency-weighted endpoint selection with ejection."""
+
+    def __init__(
+        self,
+        urls: List[str],
+        eject_after: int = 3,
+        eject_seconds: float = 30.0,
+        slow_start_seconds: float = 60.0,
+        initial_latency: float = 1.0,
+        log: Callable[[str], None] = print,
+    ):
+        if not urls:
+            raise ValueError("at least one endpoint is required")
+        self.endpoints = [Endpoint(url, initial_latency) for url in urls]
+        self.eject_after = eject_after
+        self.eject_seconds = eject_seconds
+        self.slow_start_seconds = slow_start_seconds
+        self.log = log
+        self._lock = threading.Lock()
+
+    def acquire(self, exclude: Iterable[str] = ()) -> Endpoint:
+        """
+        Choose an endpoint for a new request and count it as outstanding.
+        Endpoints in `exclude` (e.g. the one a retry just failed on) and
+        ejected ones are only used when nothing else is left.
+        """
+        excluded = set(exclude)
+        now = time.monotonic()
+        with self._lock:
+            healthy = [e for e in self.endpoints if e.ejected_until <= now]
+            candidates = [e for e in healthy if e.url not in excluded] or healthy
+            if not candidates:
+                # Every replica is ejected: try the one due back first
+                candidates = [min(self.endpoints, key=lambda e: e.ejected_until)]
+            for e in candidates:
+                if e.ejected_until and e.ejected_until <= now and not e.returned_at:
+                    e.returned_at = now
+                    self.log(f"LLM endpoint {e.url} back in rotation (slow start).")
+            best = min(
+                candidates,
+                key=lambda e: (e.outstanding + 1) * e.latency / e.weight(now, self.slow_start_seconds),
+            )
+            best.outstanding += 1
+            best.requests += 1
+            return best
+
+    def release(self, endpoint: Endpoint, latency: Optional[float], healthy: bool) -> bool:
+        """
+        Finish a request on endpoint. `latency` (seconds) updates the
+        smoothed latency of a successful request; an unhealthy outcome counts
+        towards ejection. Returns True if this call ejected the endpoint.
+        """
+        now = time.monotonic()
+        with self._lock:
+            endpoint.outstanding -= 1
+            if healthy:
+                endpoint.failures = 0
+                if endpoint.returned_at and now - endpoint.returned_at > self.slow_start_seconds:
+                    # Fully recovered: a later ejection starts short again
+                    endpoint.ejections = 0
+                if latency is not None:
+                    endpoint.latency = 0.8 * endpoint.latency + 0.2 * latency
+                return False
+
+            endpoint.failures += 1
+            if endpoint.failures < self.eject_after or endpoint.ejected_until > now:
+                return False
+            endpoint.ejections += 1
+            duration = min(self.eject_seconds * 2 ** (endpoint.ejections - 1), 10 * self.eject_seconds)
+            endpoint.ejected_until = now + duration
+            endpoint.returned_at = 0.0
+            endpoint.failures = 0
+            self.log(
+                f"LLM endpoint {endpoint.url} ejected for {duration:g}s "
+                f"after {self.eject_after} consecutive failures."
+            )
+            return True
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Sliding-window splitting of oversized single-file diffs.
+
+A file diff larger than the review budget is cut at hunk boundaries first;
+a hunk that is still too large is cut inside at brace-balanced C# member
+boundaries (a closing brace, statement end or blank line at the
+shallowest nesting level available near the cut), ignoring braces in
+literals and comments. Consecutive windows overlap by a few lines so a
+finding that straddles a cut is still visible in full in one of them.
+Every window is a valid diff on its own: it repeats the file header,
+carries recomputed `@@` line ranges and ends on a context line so that
+`git apply` places it correctly. Window sizes are measured on the rendered
+window text, so no window exceeds the budget.
+
+Usage (benchmark on a synthetic diff):
+    diff_split.py --bench [megabytes]
+"""
+
+import re
+import sys
+import time
+from typing import Callable, List, Optional, Tuple
+
+_HUNK_RE = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@(.*)$")
+
+# String/char literals, line comments and block comments (a block comment
+# left open at the end of a line captures an empty group 1)
+_NOISE_RE = re.compile(
+    r'@"(?:""|[^"])*"|"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])+\'|//.*|/\*.*?(\*/|$)'
+)
+
+
+def _parse(diff: str) -> Tuple[List[str], List[Tuple[str, List[str]]]]:
+    """Split a file diff into its header lines and (hunk header, body) pairs."""
+    header: List[str] = []
+    hunks: List[Tuple[str, List[str]]] = []
+    for line in diff.splitlines():
+        if line.startswith("@@"):
+            hunks.append((line, []))
+        elif hunks:
+            hunks[-1][1].append(line)
+        else:
+            header.append(line)
+    return header, hunks
+
+
+def _strip_noise(code: str, in_comment: bool) -> Tuple[str, bool]:
+    """
+    Remove literals and comments from one line of code. `in_comment` says
+    whether the line starts inside a block comment; the second value says
+    whether the next one does.
+    """
+    if in_comment:
+        close = code.find("*/")
+        if close < 0:
+            return "", True
+        code = code[close + 2:]
+    still_open = False
+
+    def drop(m: "re.Match[str]") -> str:
+        nonlocal still_open
+        still_open = m.group(1) == ""
+        return ""
+
+    return _NOISE_RE.sub(drop, code), still_open
+
+
+def _member_boundaries(body: List[str]) -> Tuple[List[bool], List[int]]:
+    """
+    For each body line, whether the hunk may be cut right after it (the
+    line closes a block, ends a statement or is blank) and the new-side
+    brace depth after it, relative to the start of the hunk.
+    """
+    cuts: List[bool] = []
+    depths: List[int] = []
+    depth = 0
+    in_comment = False
+    for line in body:
+        if line.startswith(("-", "\\")):
+            cuts.append(False)
+            depths.append(depth)
+            continue
+        code, in_comment = _strip_noise(line[1:], in_comment)
+        code = code.strip()
+        depth += code.count("{") - code.count("}")
+        cuts.append(not in_comment and (not code or code.endswith(("}", ";"))))
+        depths.append(depth)
+    return cuts, depths
+
+
+def _line_offsets(body: List[str]) -> Tuple[List[int], List[int]]:
+    """Prefix counts of old-side and new-side lines before each body line."""
+    old = [0]
+    new = [0]
+    for line in body:
+        old.append(old[-1] + (not line.startswith(("+", "\\"))))
+        new.append(new[-1] + (not line.startswith(("-", "\\"))))
+    return old, new
+
+
+def _sub_hunk(
+    header: str,
+    body: List[str],
+    start: int,
+    end: int,
+    offsets: Tuple[List[int], List[int]],
+) -> str:
+    """Render body[start:end] as a hunk with recomputed line ranges."""
+    m = _HUNK_RE.match(header)
+    if m is None:
+        return "\n".join([header] + body[start:end])
+    old, new = offsets
+    old_line = int(m.group(1)) + old[start]
+    new_line = int(m.group(3)) + new[start]
+    old_count = old[end] - old[start]
+    new_count = new[end] - new[start]
+    return "\n".join(
+        [f"@@ -{old_line},{old_count} +{new_line},{new_count} @@{m.group(5)}"] + body[start:end]
+    )
+
+
+def _split_hunk(
+    header: str,
+    body: List[str],
+    budget: int,
+    measure: Callable[[List[str]], int],
+    count_tokens: Callable[[str], int],
+    overlap: int,
+) -> List[Tuple[str, int]]:
+    """
+    Cut one oversized hunk into (sub-hunk, window tokens) pairs, each
+    fitting in a window of budget tokens as rendered by `measure`. Each
+    cut is made at the shallowest member boundary in the second half of
+    the window (the latest one on ties), else after its last context line,
+    else at the budget.
+    """
+    offsets = _line_offsets(body)
+    n = len(body)
+    # Per-line costs only estimate where to cut; the rendered window decides
+    costs = [count_tokens("\n" + line) for line in body]
+    limit = max(1, budget - measure([header]))
+    members, depths = _member_boundaries(body)
+    # git apply anchors a hunk without trailing context at the end of the
+    # file, so cut after context lines (any line when there is no old side)
+    new_file = offsets[0][n] == 0
+    cuts = [
+        (new_file or line.startswith(" ")) and not (i + 1 < n and body[i + 1].startswith("\\"))
+        for i, line in enumerate(body)
+    ]
+    windows: List[Tuple[str, int]] = []
+
+    start = 0
+    while start < n:
+        used = 0
+        hard_end = start
+        while hard_end < n and (hard_end == start or used + costs[hard_end] <= limit):
+            used += costs[hard_end]
+            hard_end += 1
+
+        while True:
+            end = hard_end
+            if hard_end < n:
+                best: Optional[int] = None
+                for i in range(start + (hard_end - start) // 2, hard_end):
+                    if cuts[i] and members[i] and (best is None or depths[i] <= depths[best]):
+                        best = i
+                if best is None:
+                    best = next((i for i in range(hard_end - 1, start - 1, -1) if cuts[i]), None)
+                if best is not None:
+                    end = best + 1
+            text = _sub_hunk(header, body, start, end, offsets)
+            size = measure([text])
+            if size <= budget or end - start <= 1:
+                break
+            # Over budget once rendered: shrink in proportion and cut again
+            hard_end = start + max(1, min(end - start - 1, (end - start) * budget // size))
+
+        if any(line.startswith(("+", "-")) for line in body[start:end]):
+            # Overlap can leave a tail window of pure context; skip those
+            windows.append((text, size))
+        if end >= n:
+            break
+        start = max(end - overlap, start + 1)
+    return windows
+
+
+def split_file_diff(
+    diff: str,
+    budget: int,
+    count_tokens: Callable[[str], int],
+    overlap_lines: int = 6,
+) -> List[str]:
+    """
+    Split one file diff into windows of at most budget tokens each (a
+    single diff line larger than that still gets a window of its own).
+    A diff that already fits is returned unchanged as the only window.
+    """
+    if count_tokens(diff) <= budget:
+        return [diff]
+
+    header, hunks = _parse(diff)
+    if not hunks:
+        return [diff]
+    header_text = "\n".join(header)
+
+    def render(parts: List[str]) -> str:
+        return "\n".join([header_text] + parts) + "\n"
+
+    def measure(parts: List[str]) -> int:
+        return count_tokens(render(parts))
+
+    # Hunks (or member-aligned slices of oversized hunks) in diff order,
+    # with the size of a window holding just that unit
+    units: List[Tuple[str, int]] = []
+    for hunk_header, body in hunks:
+        text = "\n".join([hunk_header] + body)
+        size = measure([text])
+        if size <= budget:
+            units.append((text, size))
+        else:
+            units.extend(_split_hunk(hunk_header, body, budget, measure, count_tokens, overlap_lines))
+
+    header_size = measure([])
+    windows: List[str] = []
+    current: List[str] = []
+    used = header_size
+    for text, size in units:
+        # Only windows that roughly fit by the sum of their units are measured
+        if current and (used + size - header_size > budget + 16 or measure(current + [text]) > budget):
+            windows.append(render(current))
+            current = []
+            used = header_size
+        current.append(text)
+        used += size - header_size
+    if current:
+        windows.append(render(current))
+    return windows
+
+
+# ---------------------------------------------------------------------------
+# Benchmark
+# ---------------------------------------------------------------------------
+
+def _synthetic_diff(megabytes: float) -> str:
+    """A new-file diff of a generated C# controller of about the given size."""
+    lines = [
+        "diff --git a/Api/Controllers/BigController.cs b/Api/Controllers/BigController.cs",
+        "new file mode 100644",
+        "index 0000000..1111111",
+        "--- /dev/null",
+        "+++ b/Api/Controllers/BigController.cs",
+    ]
+    body: List[str] = ["+namespace Api.Controllers", "+{", "+    public class BigController : ControllerBase", "+    {"]
+    size = 0
+    i = 0
+    target = int(megabytes * 1024 * 1024)
+    while size < target:
+        member = [
+            f"+        [HttpGet(\"items/{{id}}/{i}\")]",
+            f"+        public async Task<IActionResult> Get{i}(int id, CancellationToken ct)",
+            "+        {",
+            f"+            var item = await _db.Items.FindAsync(new object[] {{ id + {i} }}, ct);",
+            "+            if (item == null) { return NotFound(); }",
+            "+            // braces in strings must not confuse the splitter: \"{\"",
+            "+            return Ok(item);",
+            "+        }",
+            "+",
+        ]
+        body.extend(member)
+        size += sum(len(line) + 1 for line in member)
+        i += 1
+    body.extend(["+    }", "+}"])
+    lines.append(f"@@ -0,0 +1,{len(body)} @@")
+    return "\n".join(lines + body) + "\n"
+
+
+def _bench(megabytes: float) -> None:
+    from tokens import TokenCounter
+
+    diff = _synthetic_diff(megabytes)
+    counter = TokenCounter()
+    started = time.perf_counter()
+    windows = split_file_diff(diff, 6000, counter.count)
+    elapsed = time.perf_counter() - started
+    sizes = [counter.count(w) for w in windows]
+    print(
+        f"{len(diff) / 1024 / 1024:.1f} MB diff -> {len(windows)} windows "
+        f"(max {max(sizes)} tokens) in {elapsed:.2f}s"
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = sys.argv[1:] if argv is None else argv
+    if not args or args[0] != "--bench":
+        print("Usage: diff_split.py --bench [megabytes]")
+        sys.exit(1)
+    _bench(float(args[1]) if len(args) > 1 else 4.0)
+
+
+if __name__ == "__main__":
+    main()
@@ -10,16 +10,68 @@ LLM Code Review using local CodeLLaMA
 
 Usage:
     llm_review.py <changed_files.txt> <output.md>
+    llm_review.py --serve [socket-path]
+
+With --serve the script runs as a long-lived review daemon on a Unix socket
+(LLM_REVIEW_SOCKET), keeping HTTP connections, token counts and other
+caches warm between builds; ci/llm_review_client.py submits jobs to it.
+The daemon (ci/review_daemon.py) keeps the LLM_* settings it was started
+with and turns away jobs configured differently, which the client then
+runs directly.
 """
 
 import os
 import sys
 import subprocess
 import textwrap
+import asyncio
+import contextlib
+import fnmatch
 import json
-from typing import List
+import math
+import re
+import socket
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed, wait
+from dataclasses import asdict, dataclass
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+try:
+    import fcntl
+except ImportError:  # not on POSIX: single-flight stays within the process
+    fcntl = None
 
 import requests
+from requests.adapters import HTTPAdapter
+import urllib3
+from urllib3.connection import HTTPConnection
+
+from review_cache import (
+    FindingCache,
+    GitNotesFindingCache,
+    ResponseCache,
+    atomic_write_json,
+    content_key,
+    prune_lru,
+    read_json,
+    stable_patch_id,
+)
+from adaptive import OK, OVERLOAD, AIMDLimiter
+from admission import AdmissionController
+from balancer import Endpoint, LoadBalancer
+from diff_split import split_file_diff
+from resilience import (
+    CircuitBreaker,
+    backoff_delay,
+    is_retryable,
+    retry_after_seconds,
+)
+from review_daemon import LLM_REVIEW_SOCKET, bind_run, current_run, run_env, serve
+from risk import RiskScorer
+from tokens import TokenCounter
 
 
 # ---------------------------------------------------------------------------
@@ -27,19 +79,405 @@ import requests
 # ---------------------------------------------------------------------------
 
 # Default endpoint for your local CodeLLaMA instance
-# Override via environment variable LLM_ENDPOINT if needed.
+# Override via environment variable LLM_ENDPOINT if needed. Several replicas
+# can be given as a comma-separated list; requests are balanced across them.
 LLM_ENDPOINT = os.environ.get(
     "LLM_ENDPOINT",
     "http://code.llama.local:8000/v1/chat/completions"
 )
+LLM_ENDPOINTS = [url.strip() for url in LLM_ENDPOINT.split(",") if url.strip()]
 
 # Name/alias of the model exposed by your local LLaMA server
 LLM_MODEL = os.environ.get("LLM_MODEL", "codellama-13b")
 
+# Model routing. With LLM_MODEL_SMALL set, review requests of at most
+# LLM_SMALL_DIFF_TOKENS diff tokens, or that only touch config files, go to
+# the small model; everything else stays on LLM_MODEL. LLM_ROUTE_RULES maps
+# path globs to models ("small", "big" or a model name), first match wins:
+#   LLM_ROUTE_RULES="*.json=small;*/Controllers/*.cs=codellama-34b"
+# A request whose files resolve to different rule models uses LLM_MODEL.
+# With LLM_ROUTE_FALLBACK=1 (default) a failed request to another model is
+# retried on LLM_MODEL.
+LLM_MODEL_SMALL = os.environ.get("LLM_MODEL_SMALL", "")
+LLM_SMALL_DIFF_TOKENS = int(os.environ.get("LLM_SMALL_DIFF_TOKENS", "1500"))
+LLM_ROUTE_RULES = os.environ.get("LLM_ROUTE_RULES", "")
+LLM_ROUTE_FALLBACK = os.environ.get("LLM_ROUTE_FALLBACK", "1") != "0"
+
+# System message sent with every review request
+SYSTEM_PROMPT = "You are a senior C# ASP.NET Core and DevOps code reviewer."
+LLM_TEMPERATURE = 0.2
+
 # If your local service needs a token, set LLM_API_KEY in Jenkins
-# and uncomment the Authorization header in call_llm().
+# and the Authorization header is added to the shared session in get_session().
 USE_AUTH_HEADER = False  # set True if you require a Bearer token
 
+# Changed files are diffed in as few `git diff` calls as possible; pathspecs
+# are batched so a single command line stays below this many characters.
+DIFF_PATHSPEC_MAX_CHARS = int(os.environ.get("LLM_DIFF_PATHSPEC_MAX_CHARS", "65536"))
+
+# "batch" (default) diffs all files in one git call; "per-file" runs one
+# `git diff` per path on a bounded worker pool of LLM_DIFF_JOBS threads.
+# Batches that git cannot run fall back to the per-file path automatically.
+DIFF_MODE = os.environ.get("LLM_DIFF_MODE", "batch")
+DIFF_JOBS = int(os.environ.get("LLM_DIFF_JOBS", str(min(8, os.cpu_count() or 1))))
+
+# All LLM calls in a run share one HTTP session. LLM_POOL_SIZE bounds the
+# number of pooled connections per endpoint; LLM_KEEPALIVE=0 closes each
+# connection after its request instead of reusing it.
+LLM_POOL_SIZE = int(os.environ.get("LLM_POOL_SIZE", "8"))
+LLM_KEEPALIVE = os.environ.get("LLM_KEEPALIVE", "1") != "0"
+
+# Timeout in seconds for one non-streamed LLM request
+LLM_TIMEOUT = float(os.environ.get("LLM_TIMEOUT", "120"))
+
+# Transient failures (connection errors, timeouts, 429 and 5xx) are retried
+# up to LLM_RETRIES times with jittered exponential backoff starting at
+# LLM_RETRY_BASE_DELAY seconds, capped at LLM_RETRY_MAX_DELAY (a server's
+# Retry-After header takes precedence). After LLM_CIRCUIT_THRESHOLD
+# consecutive failures the endpoint is considered down and the remaining
+# requests of the run fail immediately (0 disables the circuit breaker).
+LLM_RETRIES = int(os.environ.get("LLM_RETRIES", "3"))
+LLM_RETRY_BASE_DELAY = float(os.environ.get("LLM_RETRY_BASE_DELAY", "1"))
+LLM_RETRY_MAX_DELAY = float(os.environ.get("LLM_RETRY_MAX_DELAY", "30"))
+LLM_CIRCUIT_THRESHOLD = int(os.environ.get("LLM_CIRCUIT_THRESHOLD", "5"))
+
+# LLM_STREAM=1 requests server-sent events ("stream": true) and writes the
+# review into the report while it is generated. A stream that delivers no
+# data for LLM_STREAM_IDLE_TIMEOUT seconds is treated as stalled.
+LLM_STREAM = os.environ.get("LLM_STREAM", "0") == "1"
+LLM_STREAM_IDLE_TIMEOUT = float(os.environ.get("LLM_STREAM_IDLE_TIMEOUT", "30"))
+
+# LLM_FAIL_FAST=1 stops the review at the first HIGH severity finding:
+# queued requests are skipped, streamed generations are aborted, a partial
+# report is written and the script exits with FAIL_FAST_EXIT_CODE.
+LLM_FAIL_FAST = os.environ.get("LLM_FAIL_FAST", "0") == "1"
+FAIL_FAST_EXIT_CODE = 3
+
+# LLM_DEADLINE_SECONDS puts a time budget on the whole review (0 = none).
+# Parts are reviewed highest priority first; request timeouts are capped at
+# the time left. With less than LLM_DEADLINE_DOWNGRADE_SECONDS left, the
+# lower-priority half goes to LLM_MODEL_SMALL (or is skipped without one),
+# and with less than LLM_DEADLINE_MIN_SECONDS left nothing new is sent.
+# Files left unreviewed are listed in the report. The review daemon takes
+# LLM_DEADLINE_SECONDS from each job.
+LLM_DEADLINE_SECONDS = float(os.environ.get("LLM_DEADLINE_SECONDS", "0"))
+LLM_DEADLINE_DOWNGRADE_SECONDS = float(os.environ.get("LLM_DEADLINE_DOWNGRADE_SECONDS", "60"))
+LLM_DEADLINE_MIN_SECONDS = float(os.environ.get("LLM_DEADLINE_MIN_SECONDS", "15"))
+
+# Review priority also weighs each file's history risk (ci/risk.py): churn,
+# authors and recency in the last LLM_RISK_MAX_COMMITS commits of
+# LLM_RISK_REF, plus HIGH findings from earlier reviews of the repository
+# (remembered under LLM_STATE_DIR and counted again only when they change). A
+# file with the highest risk gains LLM_RISK_WEIGHT priority points (code
+# files start at 3, config at 1). LLM_RISK=0 turns it off.
+LLM_RISK = os.environ.get("LLM_RISK", "1") != "0"
+LLM_RISK_REF = os.environ.get("LLM_RISK_REF", "origin/main")
+LLM_RISK_MAX_COMMITS = int(os.environ.get("LLM_RISK_MAX_COMMITS", "20000"))
+LLM_RISK_WEIGHT = float(os.environ.get("LLM_RISK_WEIGHT", "3"))
+
+# Diffs larger than this many (estimated) tokens are split into several
+# review requests whose findings are merged into one report.
+LLM_CHUNK_TOKENS = int(os.environ.get("LLM_CHUNK_TOKENS", "6000"))
+
+# Token budgeting. LLM_CONTEXT_TOKENS is the model's context window. Each
+# prompt is kept within LLM_PROMPT_TOKEN_BUDGET (default: the window minus
+# LLM_MAX_TOKENS) and max_tokens is set to the room left in the window,
+# capped at LLM_MAX_TOKENS. Point LLM_TOKENIZER at the model's
+# tokenizer.json or tokenizer.model for exact counts instead of estimates.
+LLM_CONTEXT_TOKENS = int(os.environ.get("LLM_CONTEXT_TOKENS", "16384"))
+LLM_MAX_TOKENS = int(os.environ.get("LLM_MAX_TOKENS", "1024"))
+LLM_PROMPT_TOKEN_BUDGET = int(
+    os.environ.get("LLM_PROMPT_TOKEN_BUDGET", str(LLM_CONTEXT_TOKENS - LLM_MAX_TOKENS))
+)
+LLM_TOKENIZER = os.environ.get("LLM_TOKENIZER", "")
+
+# A single file diff larger than a chunk is split into windows at hunk and
+# C# member boundaries; consecutive windows share this many lines.
+LLM_SPLIT_OVERLAP_LINES = int(os.environ.get("LLM_SPLIT_OVERLAP_LINES", "6"))
+
+# LLM_CACHE_PROMPT=1 adds "cache_prompt": true to requests, which asks a
+# llama.cpp server to keep the shared prompt prefix in its KV cache.
+LLM_CACHE_PROMPT = os.environ.get("LLM_CACHE_PROMPT", "0") == "1"
+
+# Maximum number of review requests in flight against the LLM server at once.
+LLM_CONCURRENCY = int(os.environ.get("LLM_CONCURRENCY", "4"))
+
+# With several endpoints, each request goes to the replica with the fewest
+# outstanding requests relative to its observed latency. A replica failing
+# LLM_EJECT_AFTER requests in a row is left out for LLM_EJECT_SECONDS
+# (doubling on repeated ejections) and then eased back in over
+# LLM_SLOW_START_SECONDS. Concurrency defaults below scale with the replicas.
+LLM_EJECT_AFTER = int(os.environ.get("LLM_EJECT_AFTER", "3"))
+LLM_EJECT_SECONDS = float(os.environ.get("LLM_EJECT_SECONDS", "30"))
+LLM_SLOW_START_SECONDS = float(os.environ.get("LLM_SLOW_START_SECONDS", "60"))
+
+# Hedging (only with several endpoints): a request that has not answered by
+# the observed p90 time to answer (first token when streaming), counted from
+# when it was sent, goes to a second replica as well and the first answer
+# wins; the other is aborted. LLM_HEDGE_AFTER fixes
+# the delay in seconds instead; LLM_HEDGE_BUDGET_PCT caps hedges at that
+# share of requests, and LLM_HEDGE=0 turns hedging off.
+LLM_HEDGE = os.environ.get("LLM_HEDGE", "1") != "0"
+LLM_HEDGE_AFTER = os.environ.get("LLM_HEDGE_AFTER", "")
+LLM_HEDGE_BUDGET_PCT = float(os.environ.get("LLM_HEDGE_BUDGET_PCT", "10"))
+LLM_HEDGE_MIN_SAMPLES = int(os.environ.get("LLM_HEDGE_MIN_SAMPLES", "10"))
+
+# With LLM_ADAPTIVE=1 (default) LLM_CONCURRENCY is only the starting point:
+# the limit grows by one per round of requests answered within
+# LLM_ADAPTIVE_TARGET_LATENCY seconds and is halved on timeouts, 429s and
+# 503s, between 1 and LLM_ADAPTIVE_MAX_CONCURRENCY (see ci/adaptive.py).
+LLM_ADAPTIVE = os.environ.get("LLM_ADAPTIVE", "1") != "0"
+LLM_ADAPTIVE_MAX_CONCURRENCY = int(
+    os.environ.get(
+        "LLM_ADAPTIVE_MAX_CONCURRENCY",
+        str(max(LLM_CONCURRENCY, LLM_POOL_SIZE) * len(LLM_ENDPOINTS)),
+    )
+)
+LLM_ADAPTIVE_TARGET_LATENCY = float(os.environ.get("LLM_ADAPTIVE_TARGET_LATENCY", "30"))
+
+# Host-wide admission control shared by every review on this agent (see
+# ci/admission.py): at most LLM_ADMISSION_MAX_INFLIGHT requests at once,
+# and a token bucket of LLM_ADMISSION_BURST prompt tokens refilled at
+# LLM_ADMISSION_TOKENS_PER_SEC (0 = no token limit). Builds of the branches
+# in LLM_ADMISSION_PRIORITY_BRANCHES are admitted first. LLM_ADMISSION=0
+# disables it; LLM_ADMISSION_DB defaults to admission.sqlite in LLM_CACHE_DIR.
+LLM_ADMISSION = os.environ.get("LLM_ADMISSION", "1") != "0"
+LLM_ADMISSION_DB = os.environ.get("LLM_ADMISSION_DB", "")
+LLM_ADMISSION_MAX_INFLIGHT = int(
+    os.environ.get("LLM_ADMISSION_MAX_INFLIGHT", str(4 * len(LLM_ENDPOINTS)))
+)
+LLM_ADMISSION_TOKENS_PER_SEC = float(os.environ.get("LLM_ADMISSION_TOKENS_PER_SEC", "0"))
+LLM_ADMISSION_BURST = float(os.environ.get("LLM_ADMISSION_BURST", "32768"))
+LLM_ADMISSION_PRIORITY_BRANCHES = [
+    b.strip() for b in os.environ.get("LLM_ADMISSION_PRIORITY_BRANCHES", "main,master").split(",") if b.strip()
+]
+
+# Responses are cached on the agent, keyed by a hash of model, system prompt,
+# user prompt and temperature. Set LLM_CACHE_DIR to an empty string to
+# disable; LLM_CACHE_MAX_MB bounds the cache size (LRU eviction).
+LLM_CACHE_DIR = os.environ.get(
+    "LLM_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "llm-review"),
+)
+LLM_CACHE_MAX_MB = int(os.environ.get("LLM_CACHE_MAX_MB", "256"))
+
+# Findings are also cached per file diff, keyed on a rebase-stable patch ID,
+# so unchanged files are not re-reviewed. LLM_FINDING_CACHE=0 disables this.
+LLM_FINDING_CACHE = os.environ.get("LLM_FINDING_CACHE", "1") != "0"
+
+# LLM_FINDING_CACHE_BACKEND=git-notes keeps those findings in git notes under
+# LLM_NOTES_REF instead, fetched from and pushed to LLM_NOTES_REMOTE so that
+# every Jenkins agent shares them (LLM_NOTES_PUSH=0 keeps them local).
+LLM_FINDING_CACHE_BACKEND = os.environ.get("LLM_FINDING_CACHE_BACKEND", "local")
+LLM_NOTES_REF = os.environ.get("LLM_NOTES_REF", "refs/notes/llm-review")
+LLM_NOTES_REMOTE = os.environ.get("LLM_NOTES_REMOTE", "origin")
+LLM_NOTES_PUSH = os.environ.get("LLM_NOTES_PUSH", "1") != "0"
+
+# LLM_INCREMENTAL=1 reviews only the files changed by the commits pushed
+# since the last reviewed commit of this branch (each in full, against
+# origin/main) and carries the earlier findings on other files forward. The
+# last reviewed SHA per branch is kept under LLM_STATE_DIR.
+LLM_INCREMENTAL = os.environ.get("LLM_INCREMENTAL", "0") == "1"
+LLM_STATE_DIR = os.environ.get(
+    "LLM_STATE_DIR",
+    os.path.join(os.path.expanduser("~"), ".local", "state", "llm-review"),
+)
+
+
+# ---------------------------------------------------------------------------
+# Run statistics
+# ---------------------------------------------------------------------------
+
+_STATS_LOCK = threading.Lock()
+
+
+def record_stat(name: str, value: float = 1) -> None:
+    """Add value to a named run statistic (thread-safe)."""
+    with _STATS_LOCK:
+        current_run().stats[name] += value
+
+
+def print_run_stats() -> None:
+    """Print the collected run statistics to the build log."""
+    collect_session_stats()
+    collect_hedge_stats()
+    stats = current_run().stats
+    if not stats:
+        return
+    print("LLM review stats:")
+    for name in sorted(stats):
+        value = stats[name]
+        if isinstance(value, float):
+            value = round(value, 3)
+        print(f"  {name}={value}")
+
+
+# ---------------------------------------------------------------------------
+# Fail-fast
+# ---------------------------------------------------------------------------
+
+TRUNCATED_NOTE = "_(review of this part was stopped by fail-fast)_"
+
+
+def review_incomplete(review: str) -> bool:
+    """
+    True for a part fail-fast or the time budget stopped: never started, or
+    cut off mid-response (partial text followed by TRUNCATED_NOTE).
+    """
+    return TRUNCATED_NOTE in review or review == DEADLINE_NOTE
+
+
+class ReviewCancelled(Exception):
+    """Raised inside an LLM call once fail-fast has stopped the review."""
+
+    def __init__(self, partial: str = ""):
+        super().__init__("review cancelled by fail-fast")
+        self.partial = partial
+
+
+def trigger_fail_fast(reason: str) -> None:
+    """Cancel all remaining LLM work (first call wins)."""
+    cancelled = current_run().cancelled
+    if LLM_FAIL_FAST and not cancelled.is_set():
+        cancelled.set()
+        print(f"Fail-fast: {reason}; cancelling remaining LLM requests.")
+
+
+def review_cancelled() -> bool:
+    """True once fail-fast has been triggered in this run."""
+    return current_run().cancelled.is_set()
+
+
+# ---------------------------------------------------------------------------
+# Deadline
+# ---------------------------------------------------------------------------
+
+DEADLINE_NOTE = "_(not reviewed: time budget exhausted)_"
+
+
+class DeadlineExceeded(Exception):
+    """Raised when an LLM call runs into the review's time budget."""
+
+
+def start_deadline() -> None:
+    """
+    Start the time budget of a run (LLM_DEADLINE_SECONDS, read per job).
+    Time a daemon job spent between the client submitting it and the
+    review starting counts against the budget.
+    """
+    run = current_run()
+    seconds = float(run_env("LLM_DEADLINE_SECONDS", str(LLM_DEADLINE_SECONDS)) or 0)
+    if seconds <= 0:
+        run.deadline = None
+        return
+    queued = max(0.0, time.time() - run.submitted) if run.submitted is not None else 0.0
+    run.deadline = time.monotonic() + seconds - queued
+
+
+def remaining_time() -> Optional[float]:
+    """Seconds left in the time budget, or None without a deadline."""
+    deadline = current_run().deadline
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def deadline_passed(slack: float = 0.5) -> bool:
+    """True once (within slack seconds of) the deadline."""
+    remaining = remaining_time()
+    return remaining is not None and remaining <= slack
+
+
+def request_timeout(timeout: float) -> float:
+    """timeout, capped at the time left before the deadline."""
+    remaining = remaining_time()
+    return timeout if remaining is None else max(0.1, min(timeout, remaining))
+
+
+def stop_requested() -> bool:
+    """True once LLM work should stop: fail-fast or the deadline."""
+    return review_cancelled() or deadline_passed()
+
+
+def stop_error() -> Exception:
+    """The exception to raise when stop_requested() interrupts a wait."""
+    return ReviewCancelled() if review_cancelled() else DeadlineExceeded("time budget exhausted")
+
+
+# ---------------------------------------------------------------------------
+# HTTP session
+# ---------------------------------------------------------------------------
+
+_SESSION: Optional[requests.Session] = None
+_SESSION_LOCK = threading.Lock()
+
+
+class _KeepAliveAdapter(HTTPAdapter):
+    """HTTPAdapter that enables TCP keep-alive on its pooled sockets."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["socket_options"] = list(HTTPConnection.default_socket_options) + [
+            (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+        ]
+        super().init_poolmanager(*args, **kwargs)
+
+
+def get_session() -> requests.Session:
+    """
+    Return the HTTP session shared by every LLM call in this run, creating
+    it on first use. Connections are pooled and kept alive between calls.
+    """
+    global _SESSION
+    with _SESSION_LOCK:
+        if _SESSION is None:
+            adapter_cls = _KeepAliveAdapter if LLM_KEEPALIVE else HTTPAdapter
+            adapter = adapter_cls(
+                pool_connections=10,
+                pool_maxsize=LLM_POOL_SIZE,
+                pool_block=True,
+            )
+
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers["Content-Type"] = "application/json"
+            session.headers["Connection"] = "keep-alive" if LLM_KEEPALIVE else "close"
+            if USE_AUTH_HEADER:
+                api_key = os.environ.get("LLM_API_KEY", "")
+                if api_key:
+                    session.headers["Authorization"] = f"Bearer {api_key}"
+            _SESSION = session
+        return _SESSION
+
+
+def collect_session_stats() -> None:
+    """
+    Record how many HTTP connections the shared session opened and how many
+    requests reused an already open one.
+    """
+    if _SESSION is None:
+        return
+    run = current_run()
+    opened, requests_sent = _session_counters()
+    opened -= run.session_baseline[0]
+    requests_sent -= run.session_baseline[1]
+    run.stats["http_connections_opened"] = opened
+    run.stats["http_connections_reused"] = max(0, requests_sent - opened)
+
+
+def _session_counters() -> Tuple[int, int]:
+    """Total (connections opened, requests sent) over the session's pools."""
+    opened = requests_sent = 0
+    if _SESSION is None:
+        return opened, requests_sent
+    for adapter in set(_SESSION.adapters.values()):
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools[key]
+            opened += pool.num_connections
+            requests_sent += pool.num_requests
+    return opened, requests_sent
+
 
 # ---------------------------------------------------------------------------
 # Helpers
@@ -75,161 +513,2087 @@ def filter_out_migrations(files: List[str]) -> List[str]:
     return result
 
 
+def get_merge_base(upstream: str = "origin/main", head: str = "HEAD") -> Optional[str]:
+    """
+    Resolve the merge-base that `git diff upstream...head` would use, so it
+    is computed once per run instead of once per file.
+    """
+    try:
+        base = subprocess.check_output(
+            ["git", "merge-base", upstream, head],
+            text=True,
+            stderr=subprocess.DEVNULL,
+            cwd=current_run().cwd,
+        )
+    except (subprocess.CalledProcessError, OSError):
+        return None
+    return base.strip() or None
+
+
+def _batch_pathspecs(paths: List[str], max_chars: int) -> List[List[str]]:
+    """Group pathspecs so no single git command line grows past max_chars."""
+    batches: List[List[str]] = []
+    current: List[str] = []
+    size = 0
+    for path in paths:
+        if current and size + len(path) + 1 > max_chars:
+            batches.append(current)
+            current = []
+            size = 0
+        current.append(path)
+        size += len(path) + 1
+    if current:
+        batches.append(current)
+    return batches
+
+
+def split_diff_by_file(diff: str, paths: List[str]) -> Dict[str, str]:
+    """
+    Split the output of one multi-file `git diff` into per-file sections,
+    keyed by the requested path each section belongs to.
+    """
+    by_header = {f"diff --git a/{p} b/{p}": p for p in paths}
+    sections: Dict[str, str] = {}
+
+    current_path: Optional[str] = None
+    current_lines: List[str] = []
+
+    def flush() -> None:
+        if current_path is not None and current_lines:
+            sections[current_path] = sections.get(current_path, "") + "".join(current_lines)
+
+    for line in diff.splitlines(keepends=True):
+        if line.startswith("diff --git "):
+            flush()
+            header = line.rstrip("\n")
+            current_path = by_header.get(header)
+            if current_path is None:
+                # Renames/copies have differing a/ and b/ sides; match on b/
+                current_path = next(
+                    (p for p in paths
+                     if header.endswith(f" b/{p}") or header.endswith(f' "b/{p}"')),
+                    None,
+                )
+            current_lines = [line]
+        elif current_path is not None:
+            current_lines.append(line)
+    flush()
+
+    return sections
+
+
+def _diff_one_file(base: str, path: str) -> str:
+    """Diff a single path against base; empty string if git fails."""
+    try:
+        return subprocess.check_output(
+            ["git", "diff", base, "HEAD", "--", path],
+            text=True,
+            stderr=subprocess.DEVNULL,
+            cwd=current_run().cwd,
+        )
+    except (subprocess.CalledProcessError, OSError):
+        return ""
+
+
+def collect_file_diffs_parallel(paths: List[str], base: str, jobs: int = DIFF_JOBS) -> Dict[str, str]:
+    """
+    Diff each path with its own `git diff`, running at most `jobs` git
+    processes at once. Results are keyed by path.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        diffs = pool.map(bind_run(lambda p: _diff_one_file(base, p)), paths)
+        return dict(zip(paths, diffs))
+
+
+def collect_file_diffs(file_list: List[str], base: Optional[str] = None) -> List[Tuple[str, str]]:
+    """
+    Collect (path, diff) pairs for the specified files against base (the
+    origin/main merge-base by default), in file_list order.
+
+    In batch mode the whole file set is diffed with a single `git diff` per
+    pathspec batch and the output is split per file in-process; in per-file
+    mode (or for batches git refuses to run) each path is diffed on a
+    bounded worker pool.
+    """
+    paths = [p for p in file_list if p]
+    if not paths:
+        return []
+
+    if base is None:
+        base = get_merge_base()
+        if base is None:
+            # Same outcome as every per-file `git diff origin/main...HEAD` failing
+            return []
+
+    if DIFF_MODE == "per-file":
+        sections = collect_file_diffs_parallel(paths, base)
+    else:
+        sections = {}
+        for batch in _batch_pathspecs(paths, DIFF_PATHSPEC_MAX_CHARS):
+            try:
+                diff = subprocess.check_output(
+                    ["git", "-c", "core.quotePath=false", "diff", base, "HEAD", "--", *batch],
+                    text=True,
+                    stderr=subprocess.DEVNULL,
+                    cwd=current_run().cwd,
+                )
+            except (subprocess.CalledProcessError, OSError):
+                # Command line too long or a bad pathspec: retry file by file
+                sections.update(collect_file_diffs_parallel(batch, base))
+                continue
+            sections.update(split_diff_by_file(diff, batch))
+
+    return [(p, sections[p]) for p in paths if sections.get(p, "").strip()]
+
+
+def format_file_diff(path: str, diff: str) -> str:
+    """Render one file diff as the markdown block used in review prompts."""
+    return f"### File: {path}\n```diff\n{diff}\n```"
+
+
 def get_diff_for_files(file_list: List[str]) -> str:
     """
     Build a combined diff text for the specified files, comparing
     origin/main...HEAD. Each file is grouped under a markdown heading.
     """
-    diff_texts = []
-    for path in file_list:
-        if not path:
-            continue
+    return "\n\n".join(format_file_diff(p, d) for p, d in collect_file_diffs(file_list))
+
+
+_RESPONSE_CACHE: Optional[ResponseCache] = None
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """Return the on-disk response cache, or None when caching is disabled."""
+    global _RESPONSE_CACHE
+    if _RESPONSE_CACHE is None and LLM_CACHE_DIR:
+        _RESPONSE_CACHE = ResponseCache(LLM_CACHE_DIR)
+    return _RESPONSE_CACHE
+
+
+def prune_caches() -> None:
+    """Trim the on-disk caches back to LLM_CACHE_MAX_MB, oldest entries first."""
+    if not LLM_CACHE_DIR:
+        return
+    directories = [os.path.join(LLM_CACHE_DIR, d) for d in ("responses", "findings", "risk")]
+    record_stat("cache_evictions", prune_lru(directories, LLM_CACHE_MAX_MB * 1024 * 1024))
+
+    # Single-flight lock files are only needed while a request is in flight.
+    # A file is removed only while holding its lock, so no holder loses it
+    # (_agent_lock re-checks that the file it locked is still linked).
+    inflight = os.path.join(LLM_CACHE_DIR, "inflight")
+    if fcntl is None:
+        return
+    cutoff = time.time() - 3600
+    try:
+        names = os.listdir(inflight)
+    except OSError:
+        names = []
+    for name in names:
+        path = os.path.join(inflight, name)
         try:
-            diff = subprocess.check_output(
-                ["git", "diff", "origin/main...HEAD", "--", path],
-                text=True,
-                stderr=subprocess.DEVNULL,
-            )
-        except subprocess.CalledProcessError:
-            # If diff fails, skip this file
+            if os.stat(path).st_mtime >= cutoff:
+                continue
+            fd = os.open(path, os.O_RDWR)
+        except OSError:
             continue
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            os.unlink(path)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
 
-        if diff.strip():
-            diff_texts.append(f"### File: {path}\n```diff\n{diff}\n```")
 
-    return "\n\n".join(diff_texts)
+def _parse_completion(data) -> Tuple[str, bool]:
+    """Extract the message text from an OpenAI-style response body."""
+    # OpenAI-style response: choices[0].message.content
+    try:
+        return data["choices"][0]["message"]["content"], True
+    except (KeyError, IndexError, TypeError):
+        # Fallback: dump raw JSON for debugging purposes
+        return (
+            "LLM returned an unexpected response structure:\n\n"
+            "```json\n" + json.dumps(data, indent=2) + "\n```"
+        ), False
 
 
-def call_llm(prompt: str) -> str:
+def _record_usage(data) -> None:
     """
-    Call the local CodeLLaMA endpoint using an OpenAI-style chat completion API.
-    Adjust this function if your server uses a different schema.
+    Record prompt tokens and prefill tokens served from the server's prefix
+    cache, as reported by vLLM/OpenAI (usage.prompt_tokens_details) or
+    llama.cpp (timings.cache_n / tokens_cached).
     """
-    headers = {
-        "Content-Type": "application/json",
-    }
+    if not isinstance(data, dict):
+        return
+    usage = data.get("usage") or {}
+    timings = data.get("timings") or {}
+    details = usage.get("prompt_tokens_details") or {}
+
+    cached = details.get("cached_tokens")
+    if cached is None:
+        cached = timings.get("cache_n", data.get("tokens_cached"))
+    prompt = usage.get("prompt_tokens")
+    if prompt is None and "prompt_n" in timings:
+        prompt = timings["prompt_n"] + (cached or 0)
+
+    if prompt:
+        record_stat("prompt_tokens_reported", prompt)
+    if cached:
+        record_stat("prefill_tokens_saved", cached)
+
+
+def _stream_chat_completion(
+    payload: Dict,
+    on_token: Optional[Callable[[str], None]],
+    endpoint: str,
+) -> Tuple[str, bool]:
+    """
+    Send a streaming chat completion request and pass each content delta to
+    on_token as it arrives. The read timeout applies between received
+    chunks, so a stalled generation fails after LLM_STREAM_IDLE_TIMEOUT.
+    """
+    try:
+        resp = get_session().post(
+            endpoint,
+            json=dict(payload, stream=True, stream_options={"include_usage": True}),
+            stream=True,
+            timeout=(request_timeout(10), request_timeout(LLM_STREAM_IDLE_TIMEOUT)),
+        )
+    except requests.exceptions.Timeout as ex:
+        if deadline_passed():
+            raise DeadlineExceeded("time budget exhausted") from ex
+        raise
+    with resp:
+        resp.raise_for_status()
+        if not resp.headers.get("Content-Type", "").startswith("text/event-stream"):
+            # Server ignored "stream": true and sent a regular response
+            data = resp.json()
+            _record_usage(data)
+            content, ok = _parse_completion(data)
+            if ok and on_token is not None:
+                on_token(content)
+            return content, ok
+
+        resp.encoding = resp.encoding or "utf-8"
+        parts: List[str] = []
+        try:
+            for line in resp.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                try:
+                    event = json.loads(data)
+                except ValueError:
+                    continue
+                # The final event carries usage/timings (often with no choices)
+                _record_usage(event)
+                try:
+                    delta = event["choices"][0].get("delta", {}).get("content")
+                except (KeyError, IndexError, TypeError, AttributeError):
+                    continue
+                if delta:
+                    parts.append(delta)
+                    if on_token is not None:
+                        on_token(delta)
+                if review_cancelled():
+                    # Leaving the with-block closes the connection, which
+                    # makes the server stop generating
+                    raise ReviewCancelled("".join(parts))
+                if deadline_passed(0):
+                    raise DeadlineExceeded("time budget exhausted")
+        except requests.exceptions.ConnectionError as ex:
+            if deadline_passed():
+                raise DeadlineExceeded("time budget exhausted") from ex
+            # requests reports a read timeout mid-body as a ConnectionError
+            # wrapping urllib3's ReadTimeoutError
+            if ex.args and isinstance(ex.args[0], urllib3.exceptions.ReadTimeoutError):
+                raise requests.exceptions.ReadTimeout(
+                    f"LLM stream stalled: no data for {LLM_STREAM_IDLE_TIMEOUT:g}s"
+                ) from ex
+            raise
+    return "".join(parts), True
 
-    if USE_AUTH_HEADER:
-        api_key = os.environ.get("LLM_API_KEY", "")
-        if api_key:
-            headers["Authorization"] = f"Bearer {api_key}"
 
+def _chat_completion(
+    prompt: str,
+    on_token: Optional[Callable[[str], None]] = None,
+    max_tokens: Optional[int] = None,
+    endpoint: str = LLM_ENDPOINTS[0],
+    model: str = LLM_MODEL,
+    stream: bool = LLM_STREAM,
+) -> Tuple[str, bool]:
+    """
+    Send one chat completion request for model to endpoint, streamed from
+    the server if stream is set. Returns the response text and whether it
+    had the expected structure (only well-formed responses are cached).
+    """
     payload = {
-        "model": LLM_MODEL,
+        "model": model,
         "messages": [
             {
                 "role": "system",
-                "content": "You are a senior C# ASP.NET Core and DevOps code reviewer.",
+                "content": SYSTEM_PROMPT,
             },
             {
                 "role": "user",
                 "content": prompt,
             },
         ],
-        "temperature": 0.2,
+        "temperature": LLM_TEMPERATURE,
     }
+    if max_tokens is not None:
+        payload["max_tokens"] = max_tokens
+    if LLM_CACHE_PROMPT:
+        payload["cache_prompt"] = True
 
-    resp = requests.post(
-        LLM_ENDPOINT,
-        headers=headers,
-        json=payload,
-        timeout=120,
-    )
-    resp.raise_for_status()
-    data = resp.json()
+    if stream:
+        return _stream_chat_completion(payload, on_token, endpoint)
 
-    # OpenAI-style response: choices[0].message.content
     try:
-        return data["choices"][0]["message"]["content"]
-    except (KeyError, IndexError, TypeError):
-        # Fallback: dump raw JSON for debugging purposes
-        return (
-            "LLM returned an unexpected response structure:\n\n"
-            "```json\n" + json.dumps(data, indent=2) + "\n```"
+        resp = get_session().post(
+            endpoint,
+            json=payload,
+            timeout=request_timeout(LLM_TIMEOUT),
         )
+    except requests.exceptions.Timeout as ex:
+        if deadline_passed():
+            raise DeadlineExceeded("time budget exhausted") from ex
+        raise
+    resp.raise_for_status()
+    data = resp.json()
+    _record_usage(data)
+    return _parse_completion(data)
+
+
+def _cached_response(key: str, on_token: Optional[Callable[[str], None]]) -> Optional[str]:
+    """Look up key in the response cache, replaying it to on_token on a hit."""
+    cache = get_response_cache()
+    if cache is None:
+        return None
+    cached = cache.get(key)
+    if cached is not None and on_token is not None:
+        on_token(cached)
+    return cached
+
+
+def call_llm(
+    prompt: str,
+    on_token: Optional[Callable[[str], None]] = None,
+    max_tokens: Optional[int] = None,
+    model: str = LLM_MODEL,
+) -> str:
+    """
+    Call the local CodeLLaMA endpoint using an OpenAI-style chat completion API.
+    Adjust _chat_completion() if your server uses a different schema.
+
+    Identical requests are answered from the on-disk response cache, and
+    identical requests made at the same time (here or by another review on
+    this agent) share one LLM call. With LLM_STREAM enabled, on_token
+    receives the response text as it arrives.
+    """
+    key = content_key(model, SYSTEM_PROMPT, prompt, LLM_TEMPERATURE, max_tokens)
+    cached = _cached_response(key, on_token)
+    if cached is not None:
+        record_stat("cache_hits")
+        return cached
+    if get_response_cache() is not None:
+        record_stat("cache_misses")
+
+    def fetch() -> str:
+        content, ok = resilient_completion(prompt, on_token, max_tokens, model)
+        cache = get_response_cache()
+        if ok and cache is not None:
+            cache.put(key, content, {"model": model})
+        return content
+
+    return single_flight(key, fetch, on_token)
 
 
 # ---------------------------------------------------------------------------
-# Main
+# Single-flight
 # ---------------------------------------------------------------------------
 
-def main() -> None:
-    if len(sys.argv) != 3:
-        print("Usage: llm_review.py <changed_files.txt> <output.md>")
-        sys.exit(1)
+_INFLIGHT: Dict[str, Future] = {}
+_INFLIGHT_LOCK = threading.Lock()
 
-    changed_files_path = sys.argv[1]
-    output_path = sys.argv[2]
 
-    # 1. Read changed files
-    all_files = read_changed_files(changed_files_path)
+@contextlib.contextmanager
+def _agent_lock(key: str):
+    """
+    Hold an exclusive lock file for key under LLM_CACHE_DIR, shared by every
+    review process on this agent. Yields True if another process held it
+    first. Without a cache directory (or flock) there is nothing to share.
+    """
+    if fcntl is None or not LLM_CACHE_DIR:
+        yield False
+        return
 
-    # 2. Filter out EF Core migrations
-    files = filter_out_migrations(all_files)
+    directory = os.path.join(LLM_CACHE_DIR, "inflight")
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, key + ".lock")
+    waited = False
+    while True:
+        fd = os.open(path, os.O_CREAT | os.O_RDWR, 0o666)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            waited = True
+            if stop_requested():
+                raise stop_error()
+            time.sleep(0.1)
+            continue
+        try:
+            linked = os.path.samestat(os.fstat(fd), os.stat(path))
+        except OSError:
+            linked = False
+        if linked:
+            break
+        # prune_caches unlinked the file before we locked it: a new one may
+        # already be locked by someone else, so start over on that one
+        os.close(fd)
+    try:
+        yield waited
+    finally:
+        # Closing the descriptor releases the lock
+        os.close(fd)
 
-    if not files:
-        with open(output_path, "w", encoding="utf-8") as out:
-            out.write(
-                "No non-migration files to review. "
-                "EF Core migration files were intentionally ignored.\n"
-            )
-        return
 
-    # 3. Build a diff block for the LLM
-    diff_block = get_diff_for_files(files)
+def single_flight(key: str, fetch: Callable[[], str], on_token: Optional[Callable[[str], None]] = None) -> str:
+    """
+    Run fetch() at most once at a time per key. Callers in this process that
+    arrive while it runs wait for it and share its result if it succeeds;
+    if it fails or is stopped (the leader may belong to another daemon job
+    with its own fail-fast and deadline), one of them fetches instead. Other
+    processes on the agent wait on the key's lock file and then find the
+    result in the response cache.
+    """
+    while True:
+        with _INFLIGHT_LOCK:
+            future = _INFLIGHT.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                _INFLIGHT[key] = future
+        if leader:
+            break
+        # Wait on our own run's fail-fast and deadline, not the leader's
+        while not wait([future], timeout=0.1).done:
+            if stop_requested():
+                raise stop_error()
+        if future.exception() is None:
+            record_stat("singleflight_shared")
+            result = future.result()
+            if on_token is not None:
+                on_token(result)
+            return result
+
+    def release() -> None:
+        with _INFLIGHT_LOCK:
+            if _INFLIGHT.get(key) is future:
+                del _INFLIGHT[key]
 
-    if not diff_block.strip():
-        with open(output_path, "w", encoding="utf-8") as out:
-            out.write("No diffs to review for the filtered file set.\n")
-        return
+    try:
+        with _agent_lock(key) as waited:
+            result = _cached_response(key, on_token) if waited else None
+            if result is not None:
+                record_stat("singleflight_shared_across_processes")
+            else:
+                result = fetch()
+    except BaseException as ex:
+        # Released first, so a woken follower becomes the next leader
+        release()
+        future.set_exception(ex)
+        raise
+    release()
+    future.set_result(result)
+    return result
 
-    # 4. Build the review prompt
-    prompt = textwrap.dedent(
-        f"""
-        You are performing a code review for a C# ASP.NET Core API project
-        and its CI/CD pipeline configuration.
 
-        Focus your review on:
-        - Correctness and potential bugs
-        - Security and input validation
-        - Performance, async, and resource usage
-        - Testability and maintainability
-        - CI/CD and Dockerfile/Jenkinsfile best practices
+# ---------------------------------------------------------------------------
+# Admission control
+# ---------------------------------------------------------------------------
+
+_ADMISSION: Optional[AdmissionController] = None
+_ADMISSION_LOCK = threading.Lock()
 
-        IMPORTANT:
-        - Ignore EF Core migration files; they were filtered out already.
-        - If the code looks reasonable overall, still highlight any potential risks or improvements.
 
-        For each issue, use this exact format:
+def get_admission() -> Optional[AdmissionController]:
+    """Return the agent-wide admission controller, or None when disabled."""
+    global _ADMISSION
+    path = LLM_ADMISSION_DB or (LLM_CACHE_DIR and os.path.join(LLM_CACHE_DIR, "admission.sqlite"))
+    if not LLM_ADMISSION or not path:
+        return None
+    with _ADMISSION_LOCK:
+        if _ADMISSION is None:
+            try:
+                _ADMISSION = AdmissionController(
+                    path,
+                    LLM_ADMISSION_TOKENS_PER_SEC,
+                    LLM_ADMISSION_BURST,
+                    LLM_ADMISSION_MAX_INFLIGHT,
+                )
+            except Exception as ex:
+                print(f"Admission control unavailable ({ex}); sending requests unthrottled.")
+                return None
+    return _ADMISSION
 
-        - [SEVERITY: LOW|MEDIUM|HIGH] Short descriptive title
-          - File: <file-path>
-          - Description: <what is wrong and why it matters>
-          - Suggestion: <specific improvement or code change>
 
-        If there are no significant issues worth mentioning, write:
-        "No major issues found in the reviewed changes."
+def admission_priority() -> int:
+    """0 for builds of a priority branch (main), 1 for everything else."""
+    branch = current_branch()
+    if branch.startswith("origin/"):
+        branch = branch[len("origin/"):]
+    return 0 if branch in LLM_ADMISSION_PRIORITY_BRANCHES else 1
 
-        Review the following diffs between origin/main and the current branch:
 
-        {diff_block}
-        """
-    )
+@contextlib.contextmanager
+def admitted(cost: int):
+    """
+    Wait for the agent-wide admission controller to let a request of cost
+    prompt tokens through and hold its slot for the duration of the block.
+    The time spent queueing is recorded as admission_wait_s.
+    """
+    controller = get_admission()
+    if controller is None:
+        yield
+        return
 
-    # 5. Call local CodeLLaMA
+    started = time.monotonic()
     try:
-        review_text = call_llm(prompt)
+        lease = controller.acquire(cost, admission_priority(), stop_requested)
     except Exception as ex:
-        review_text = (
-            f"Error calling local CodeLLaMA at {LLM_ENDPOINT}:\n\n"
-            f"{type(ex).__name__}: {ex}\n"
-        )
+        # A broken database must not stop the review
+        print(f"Admission control failed ({ex}); sending request unthrottled.")
+        controller = None
+        lease = ""
+    waited = time.monotonic() - started
+    record_stat("admission_wait_s", waited)
+    with _STATS_LOCK:
+        stats = current_run().stats
+        stats["admission_max_wait_s"] = max(stats["admission_max_wait_s"], waited)
+    if lease is None:
+        raise stop_error()
+    try:
+        yield
+    finally:
+        if controller is not None:
+            try:
+                controller.release(lease)
+            except Exception as ex:
+                # The lease is reclaimed once this process exits
+                print(f"Could not release admission lease ({ex}).")
 
-    # 6. Write markdown report
-    with open(output_path, "w", encoding="utf-8") as out:
-        out.write("# LLM Code Review (CodeLLaMA)\n\n")
-        out.write(review_text)
-        out.write("\n")
+
+# ---------------------------------------------------------------------------
+# Load balancing
+# ---------------------------------------------------------------------------
+
+_BALANCER: Optional[LoadBalancer] = None
+_BALANCER_LOCK = threading.Lock()
+
+
+def get_balancer() -> LoadBalancer:
+    """
+    Return the process-wide load balancer over LLM_ENDPOINTS. Like the
+    adaptive limiter it outlives a run, so a daemon remembers replica health.
+    """
+    global _BALANCER
+    with _BALANCER_LOCK:
+        if _BALANCER is None:
+            _BALANCER = LoadBalancer(
+                LLM_ENDPOINTS,
+                eject_after=LLM_EJECT_AFTER,
+                eject_seconds=LLM_EJECT_SECONDS,
+                slow_start_seconds=LLM_SLOW_START_SECONDS,
+            )
+    return _BALANCER
+
+
+def release_endpoint(endpoint: Endpoint, latency: Optional[float], healthy: bool) -> None:
+    """Report a finished request to the load balancer and the run stats."""
+    if get_balancer().release(endpoint, latency, healthy):
+        record_stat("endpoint_ejections")
+
+
+# ---------------------------------------------------------------------------
+# Adaptive concurrency
+# ---------------------------------------------------------------------------
+
+_LIMITER: Optional[AIMDLimiter] = None
+_LIMITER_LOCK = threading.Lock()
+
+
+def get_limiter() -> Optional[AIMDLimiter]:
+    """
+    Return the process-wide AIMD limiter, or None when LLM_ADAPTIVE is off.
+    It outlives a single run, so a daemon keeps what it learned.
+    """
+    global _LIMITER
+    if not LLM_ADAPTIVE:
+        return None
+    with _LIMITER_LOCK:
+        if _LIMITER is None:
+            _LIMITER = AIMDLimiter(
+                initial=LLM_CONCURRENCY,
+                maximum=LLM_ADAPTIVE_MAX_CONCURRENCY,
+                target_latency=LLM_ADAPTIVE_TARGET_LATENCY,
+            )
+    return _LIMITER
+
+
+def request_concurrency() -> int:
+    """Upper bound on review requests to start at once."""
+    limiter = get_limiter()
+    return LLM_CONCURRENCY if limiter is None else limiter.maximum
+
+
+def _is_overload(ex: BaseException) -> bool:
+    """Whether an LLM call failure means the server is saturated."""
+    if isinstance(ex, requests.exceptions.Timeout):
+        return True
+    if isinstance(ex, requests.exceptions.HTTPError) and ex.response is not None:
+        return ex.response.status_code in (429, 503)
+    return False
+
+
+@contextlib.contextmanager
+def adaptive_slot():
+    """
+    Hold one of the adaptive limiter's slots for the duration of the block
+    and feed the outcome back into it. Yields a function that restarts the
+    latency clock (so time spent queueing elsewhere is not counted).
+    """
+    limiter = get_limiter()
+    if limiter is None:
+        yield lambda: None
+        return
+
+    started = limiter.acquire(stop_requested)
+    if started is None:
+        raise stop_error()
+    clock = [started]
+
+    def restart_clock() -> None:
+        clock[0] = max(clock[0], time.monotonic())
+
+    outcome = "error"
+    try:
+        yield restart_clock
+        outcome = OK
+    except BaseException as ex:
+        if _is_overload(ex):
+            outcome = OVERLOAD
+        raise
+    finally:
+        limiter.release(clock[0], outcome)
+        with _STATS_LOCK:
+            stats = current_run().stats
+            stats["adaptive_limit"] = int(limiter.limit)
+            stats["adaptive_limit_peak"] = max(stats["adaptive_limit_peak"], limiter.peak)
+        if outcome == OVERLOAD:
+            record_stat("adaptive_overloads")
+
+
+# ---------------------------------------------------------------------------
+# Retries and circuit breaker
+# ---------------------------------------------------------------------------
+
+
+def _send_once(
+    prompt: str,
+    on_token: Optional[Callable[[str], None]],
+    max_tokens: Optional[int],
+    failed_endpoints: List[str],
+    avoid: Tuple[str, ...] = (),
+    chosen: Optional[List[str]] = None,
+    model: str = LLM_MODEL,
+    sent: Optional[threading.Event] = None,
+    stream: bool = LLM_STREAM,
+) -> Tuple[str, bool]:
+    """
+    One attempt at a chat completion, within the concurrency limits, on the
+    replica chosen by the load balancer. Replicas in failed_endpoints and
+    avoid are passed over, a replica that fails this attempt is added to
+    failed_endpoints, and the replica used is appended to chosen. sent is
+    set once the request leaves local queueing for the replica.
+    """
+    with adaptive_slot() as restart_clock:
+        with admitted(prompt_tokens(prompt)):
+            # Latency is measured from when the request is actually sent
+            restart_clock()
+            endpoint = get_balancer().acquire(failed_endpoints + list(avoid))
+            if chosen is not None:
+                chosen.append(endpoint.url)
+            if sent is not None:
+                sent.set()
+            if len(LLM_ENDPOINTS) > 1:
+                record_stat("endpoint_requests." + urlsplit(endpoint.url).netloc)
+            started = time.monotonic()
+            first_token: List[float] = []
+
+            def tap(text: str) -> None:
+                if not first_token:
+                    first_token.append(time.monotonic() - started)
+                on_token(text)
+
+            try:
+                result = _chat_completion(
+                    prompt, tap if on_token is not None else None, max_tokens, endpoint.url, model, stream
+                )
+            except HedgeLost:
+                # Aborted in favour of the other attempt; the replica is fine
+                release_endpoint(endpoint, None, True)
+                raise
+            except Exception as ex:
+                healthy = not is_retryable(ex)
+                if not healthy:
+                    failed_endpoints.append(endpoint.url)
+                release_endpoint(endpoint, None, healthy)
+                raise
+            except BaseException:
+                release_endpoint(endpoint, None, True)
+                raise
+            elapsed = time.monotonic() - started
+            release_endpoint(endpoint, elapsed, True)
+            # A streamed answer has arrived once its first token has
+            record_answer_latency(model, first_token[0] if LLM_STREAM and first_token else elapsed)
+            return result
+
+
+def resilient_completion(
+    prompt: str,
+    on_token: Optional[Callable[[str], None]] = None,
+    max_tokens: Optional[int] = None,
+    model: str = LLM_MODEL,
+) -> Tuple[str, bool]:
+    """
+    _chat_completion() with hedging and bounded retries of transient
+    failures. A stream that already delivered text is not retried, since its
+    output has been passed on. Raises CircuitOpenError once the endpoint is
+    considered down.
+    """
+    streamed = False
+    failed_endpoints: List[str] = []
+
+    def forward(text: str) -> None:
+        nonlocal streamed
+        streamed = True
+        on_token(text)
+
+    run = current_run()
+    attempt = 0
+    while True:
+        run.breaker.check()
+        try:
+            result = hedged_send(prompt, forward if on_token is not None else None, max_tokens, failed_endpoints, model)
+        except ReviewCancelled:
+            raise
+        except Exception as ex:
+            if not is_retryable(ex):
+                raise
+            if run.breaker.record_failure(ex):
+                record_stat("circuit_opened")
+                print(f"Circuit breaker open: {run.breaker.opened_reason}; failing remaining LLM requests fast.")
+            if attempt >= LLM_RETRIES or streamed or run.breaker.is_open:
+                raise
+
+            delay = retry_after_seconds(ex)
+            if delay is None:
+                delay = backoff_delay(attempt, LLM_RETRY_BASE_DELAY, LLM_RETRY_MAX_DELAY)
+            delay = min(delay, LLM_RETRY_MAX_DELAY)
+            remaining = remaining_time()
+            if remaining is not None and delay + LLM_DEADLINE_MIN_SECONDS > remaining:
+                # No time left for another attempt
+                raise
+            attempt += 1
+            record_stat("llm_retries")
+            print(f"LLM request failed ({type(ex).__name__}: {ex}); retry {attempt}/{LLM_RETRIES} in {delay:.1f}s.")
+            if run.cancelled.wait(delay):
+                raise ReviewCancelled()
+            continue
+
+        run.breaker.record_success()
+        return result
+
+
+# ---------------------------------------------------------------------------
+# Hedged requests
+# ---------------------------------------------------------------------------
+
+# Recent time-to-answer samples of successful requests per model (process-wide)
+_ANSWER_LATENCIES: Dict[str, Deque[float]] = {}
+_LATENCY_LOCK = threading.Lock()
+
+
+class HedgeLost(Exception):
+    """Raised inside the slower of a request and its hedge to abort it."""
+
+
+def record_answer_latency(model: str, seconds: float) -> None:
+    with _LATENCY_LOCK:
+        _ANSWER_LATENCIES.setdefault(model, deque(maxlen=200)).append(seconds)
+
+
+def hedge_delay(model: str) -> Optional[float]:
+    """
+    How long to wait for an answer from model before hedging:
+    LLM_HEDGE_AFTER, or the observed p90 time to answer. None while hedging
+    is off or there are too few samples.
+    """
+    if not LLM_HEDGE or len(LLM_ENDPOINTS) < 2:
+        return None
+    if LLM_HEDGE_AFTER:
+        return float(LLM_HEDGE_AFTER)
+    with _LATENCY_LOCK:
+        samples = sorted(_ANSWER_LATENCIES.get(model, ()))
+    if len(samples) < LLM_HEDGE_MIN_SAMPLES:
+        return None
+    return samples[min(len(samples) - 1, int(len(samples) * 0.9))]
+
+
+def _hedge_allowed() -> bool:
+    """Take one hedge from the budget if that keeps hedges within LLM_HEDGE_BUDGET_PCT."""
+    with _STATS_LOCK:
+        stats = current_run().stats
+        if (stats["hedges_sent"] + 1) * 100 > LLM_HEDGE_BUDGET_PCT * stats["hedge_eligible"]:
+            return False
+        stats["hedges_sent"] += 1
+        return True
+
+
+class _HedgeRace:
+    """
+    First answer wins between a request (attempt 0) and its hedge (1). Both
+    attempts are streamed from the server (and collected whole when the
+    review does not stream), so an attempt answers with its first token and
+    the loser is aborted as soon as it produces output, which closes its
+    connection, stops the generation and frees its slots.
+    """
+
+    def __init__(self, on_token: Optional[Callable[[str], None]]):
+        self.on_token = on_token
+        self.winner: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def claim(self, index: int) -> bool:
+        with self._lock:
+            if self.winner is None:
+                self.winner = index
+            return self.winner == index
+
+    def sink(self, index: int) -> Callable[[str], None]:
+        def forward(text: str) -> None:
+            if not self.claim(index):
+                raise HedgeLost()
+            if self.on_token is not None:
+                self.on_token(text)
+
+        return forward
+
+
+def hedged_send(
+    prompt: str,
+    on_token: Optional[Callable[[str], None]],
+    max_tokens: Optional[int],
+    failed_endpoints: List[str],
+    model: str = LLM_MODEL,
+) -> Tuple[str, bool]:
+    """
+    _send_once(), duplicated to a second replica if it has not answered
+    within hedge_delay() and the hedging budget allows it. Returns the
+    first answer.
+    """
+    delay = hedge_delay(model)
+    if delay is None:
+        return _send_once(prompt, on_token, max_tokens, failed_endpoints, model=model)
+
+    record_stat("hedge_eligible")
+    race = _HedgeRace(on_token)
+    primary_endpoint: List[str] = []
+    primary_sent = threading.Event()
+
+    def attempt(
+        index: int,
+        avoid: Tuple[str, ...],
+        chosen: Optional[List[str]],
+        sent: Optional[threading.Event],
+    ) -> Future:
+        future: Future = Future()
+
+        def run() -> None:
+            try:
+                result = _send_once(
+                    prompt, race.sink(index), max_tokens, failed_endpoints, avoid, chosen, model, sent, True
+                )
+            except BaseException as ex:
+                future.set_exception(ex)
+                return
+            race.claim(index)
+            future.set_result(result)
+
+        threading.Thread(target=bind_run(run), name=f"llm-hedge-{index}", daemon=True).start()
+        return future
+
+    futures = [attempt(0, (), primary_endpoint, primary_sent)]
+    # Latency samples are taken from the send, so time spent queueing for
+    # admission or an adaptive slot must not count towards the hedge delay
+    while not primary_sent.wait(0.1) and not futures[0].done():
+        pass
+    wait(futures, timeout=delay)
+    if not futures[0].done() and race.winner is None and primary_endpoint and _hedge_allowed():
+        futures.append(attempt(1, tuple(primary_endpoint), None, None))
+
+    error: Optional[BaseException] = None
+    for future in as_completed(futures):
+        index = futures.index(future)
+        if race.winner not in (None, index):
+            continue
+        try:
+            result = future.result()
+        except HedgeLost:
+            continue
+        except BaseException as ex:
+            if race.winner == index:
+                raise
+            error = ex
+            continue
+        if index == 1:
+            record_stat("hedges_won")
+        return result
+    raise error
+
+
+def collect_hedge_stats() -> None:
+    """Add hedge and win rates to the run statistics."""
+    with _STATS_LOCK:
+        stats = current_run().stats
+        eligible = stats["hedge_eligible"]
+        sent = stats["hedges_sent"]
+        if eligible:
+            stats["hedge_rate"] = sent / eligible
+        if sent:
+            stats["hedge_win_rate"] = stats["hedges_won"] / sent
+
+
+# ---------------------------------------------------------------------------
+# Scheduling
+# ---------------------------------------------------------------------------
+
+# Review priority by file type; anything else counts 1
+_TYPE_PRIORITY = {".cs": 3.0, ".fs": 3.0, ".vb": 3.0, "Dockerfile": 2.0, "Jenkinsfile": 2.0}
+
+
+def file_priority(path: str, diff: str) -> float:
+    """
+    How urgently a file diff should be reviewed: code before build files
+    before config, and larger changes first within a type.
+    """
+    name = os.path.basename(path)
+    weight = _TYPE_PRIORITY.get(name, _TYPE_PRIORITY.get(os.path.splitext(name)[1], 1.0))
+    changed = sum(
+        1 for line in diff.splitlines()
+        if line.startswith(("+", "-")) and not line.startswith(("+++", "---"))
+    )
+    return weight + math.log1p(changed) / 10
+
+
+# Most recent distinct HIGH findings remembered per repository
+HIGH_HISTORY_LIMIT = 5000
+
+
+def _high_history_path() -> str:
+    """File of (file, title) pairs of this repository's past HIGH findings."""
+    return os.path.join(LLM_STATE_DIR, content_key(repository_id(), "high-findings") + ".json")
+
+
+def _read_high_history() -> List[Tuple[str, str]]:
+    history = read_json(_high_history_path())
+    if not isinstance(history, list):
+        return []
+    return [(p[0], p[1]) for p in history if isinstance(p, list) and len(p) == 2]
+
+
+def record_high_findings(findings: List["Finding"]) -> None:
+    """Remember this repository's new HIGH findings for risk scoring."""
+    new = [(f.file, f.title.lower()) for f in findings if f.severity == "HIGH" and f.file]
+    if not new:
+        return
+    pairs = _read_high_history()
+    known = set(pairs)
+    added = [key for key in dict.fromkeys(new) if key not in known]
+    if not added:
+        return
+    pairs.extend(added)
+    try:
+        atomic_write_json(_high_history_path(), [list(p) for p in pairs[-HIGH_HISTORY_LIMIT:]])
+    except OSError as ex:
+        print(f"Could not save HIGH finding history: {ex}")
+
+
+def past_high_stamp() -> str:
+    """Version of the sources past_high_findings() reads, for its cache."""
+    try:
+        st = os.stat(_high_history_path())
+        stamp = f"{st.st_size}:{st.st_mtime_ns}"
+    except OSError:
+        stamp = ""
+    if isinstance(get_finding_cache(), GitNotesFindingCache):
+        stamp += ":" + (git_rev_parse(LLM_NOTES_REF) or "")
+    return stamp
+
+
+def past_high_findings() -> Dict[str, int]:
+    """
+    Number of distinct HIGH findings per file in earlier reviews of this
+    repository: those recorded on this agent and, with the git-notes
+    backend, those shared through the notes.
+    """
+    pairs = set(_read_high_history())
+    cache = get_finding_cache()
+    if isinstance(cache, GitNotesFindingCache):
+        for findings in cache.all_findings():
+            for item in findings:
+                if item.get("severity") != "HIGH":
+                    continue
+                finding = Finding(item["severity"], item.get("title", ""), item.get("details", ""))
+                if finding.file:
+                    pairs.add((finding.file, finding.title.lower()))
+    return dict(Counter(path for path, _title in pairs))
+
+
+def risk_scores(paths: List[str]) -> Dict[str, float]:
+    """History risk (0 to 1) of each path; empty when LLM_RISK is off or it fails."""
+    if not LLM_RISK or not paths:
+        return {}
+    started = time.monotonic()
+    try:
+        scorer = RiskScorer(
+            LLM_RISK_REF, LLM_CACHE_DIR, LLM_RISK_MAX_COMMITS, repo=repository_id(), cwd=current_run().cwd
+        )
+        scores = scorer.scores(paths, scorer.past_high(past_high_findings, past_high_stamp()))
+    except Exception as ex:
+        print(f"Risk scoring failed ({type(ex).__name__}: {ex}); using file type priorities only.")
+        return {}
+    record_stat("risk_scoring_s", time.monotonic() - started)
+    return scores
+
+
+def chunk_priorities(chunks: List[List[Tuple[str, str]]]) -> List[float]:
+    """Priority of each chunk: that of its most urgent file, risk included."""
+    risk = risk_scores(sorted({p for chunk in chunks for p, _ in chunk}))
+    return [
+        max((file_priority(p, d) + LLM_RISK_WEIGHT * risk.get(p, 0.0) for p, d in chunk), default=0.0)
+        for chunk in chunks
+    ]
+
+
+def schedule_order(priorities: List[float]) -> List[int]:
+    """Chunk indices, highest priority first (ties keep chunk order)."""
+    return sorted(range(len(priorities)), key=lambda i: -priorities[i])
+
+
+def unreviewed_files(chunks: List[List[Tuple[str, str]]], reviews: List[str]) -> List[str]:
+    """
+    Files of chunks that the time budget left unreviewed, in order; a file
+    split into windows of which only some were reviewed is marked partial.
+    """
+    skipped: List[str] = []
+    reviewed = set()
+    for chunk, review in zip(chunks, reviews):
+        for path, _diff in chunk:
+            if review != DEADLINE_NOTE:
+                reviewed.add(path)
+            elif path not in skipped:
+                skipped.append(path)
+    return [f"`{p}` (partly reviewed)" if p in reviewed else f"`{p}`" for p in skipped]
+
+
+# ---------------------------------------------------------------------------
+# Model routing
+# ---------------------------------------------------------------------------
+
+# Files whose diffs are configuration rather than code
+CONFIG_SUFFIXES = (".json", ".config", ".xml", ".yml", ".yaml", ".props", ".targets", ".csproj")
+
+
+def parse_route_rules(text: str) -> List[Tuple[str, str]]:
+    """Parse "glob=model;glob=model" into (glob, model name) pairs."""
+    aliases = {"small": LLM_MODEL_SMALL or LLM_MODEL, "big": LLM_MODEL}
+    rules: List[Tuple[str, str]] = []
+    for item in re.split(r"[;\n]", text):
+        pattern, sep, model = item.partition("=")
+        if not sep or not pattern.strip() or not model.strip():
+            continue
+        model = model.strip()
+        rules.append((pattern.strip(), aliases.get(model, model)))
+    return rules
+
+
+_ROUTE_RULES = parse_route_rules(LLM_ROUTE_RULES)
+
+
+def routing_id() -> str:
+    """Identity of the model routing setup (just LLM_MODEL without routing)."""
+    if not LLM_MODEL_SMALL and not _ROUTE_RULES:
+        return LLM_MODEL
+    return content_key(LLM_MODEL, LLM_MODEL_SMALL, LLM_SMALL_DIFF_TOKENS, _ROUTE_RULES)
+
+
+def _size_policy_model(chunk: List[Tuple[str, str]]) -> str:
+    """The small model for config-only or small requests, else LLM_MODEL."""
+    if not LLM_MODEL_SMALL:
+        return LLM_MODEL
+    if all(path.endswith(CONFIG_SUFFIXES) for path, _diff in chunk):
+        return LLM_MODEL_SMALL
+    tokens = sum(estimate_tokens(diff) for _path, diff in chunk)
+    return LLM_MODEL_SMALL if tokens <= LLM_SMALL_DIFF_TOKENS else LLM_MODEL
+
+
+def route_model(chunk: List[Tuple[str, str]]) -> str:
+    """
+    Pick the model for one review request. Each file takes the model of
+    the first matching route rule, or else the size/type policy model of
+    the whole request; if the files disagree, LLM_MODEL is used.
+    """
+    models = set()
+    for path, _diff in chunk:
+        for pattern, model in _ROUTE_RULES:
+            if fnmatch.fnmatch(path, pattern):
+                models.add(model)
+                break
+        else:
+            models.add(_size_policy_model(chunk))
+    return models.pop() if len(models) == 1 else LLM_MODEL
+
+
+# ---------------------------------------------------------------------------
+# Chunked review
+# ---------------------------------------------------------------------------
+
+SEVERITY_ORDER = {"HIGH": 0, "MEDIUM": 1, "LOW": 2}
+
+NO_ISSUES_TEXT = "No major issues found in the reviewed changes."
+
+_FINDING_RE = re.compile(r"^\s*[-*]?\s*\[SEVERITY:\s*(LOW|MEDIUM|HIGH)\]\s*(.*)$")
+_FILE_RE = re.compile(r"^\s*[-*]?\s*File:\s*`?([^`]+?)`?\s*$")
+
+
+@dataclass
+class Finding:
+    """One `[SEVERITY: ...]` item from a review, with its indented details."""
+
+    severity: str
+    title: str
+    details: str = ""
+
+    @property
+    def file(self) -> str:
+        for line in self.details.splitlines():
+            m = _FILE_RE.match(line)
+            if m:
+                return m.group(1)
+        return ""
+
+    def render(self) -> str:
+        text = f"- [SEVERITY: {self.severity}] {self.title}"
+        if self.details:
+            text += "\n" + self.details
+        return text
+
+
+_TOKEN_COUNTER: Optional[TokenCounter] = None
+
+# Allowance for the chat template wrapped around the system and user messages
+CHAT_TEMPLATE_TOKENS = 16
+
+
+def get_token_counter() -> TokenCounter:
+    """Return the run's token counter (exact if LLM_TOKENIZER is usable)."""
+    global _TOKEN_COUNTER
+    if _TOKEN_COUNTER is None:
+        _TOKEN_COUNTER = TokenCounter(LLM_TOKENIZER)
+    return _TOKEN_COUNTER
+
+
+def estimate_tokens(text: str) -> int:
+    """Token count of text, used for budgeting chunks and prompts."""
+    return get_token_counter().count(text)
+
+
+def prompt_tokens(prompt: str) -> int:
+    """Tokens a request with this user prompt occupies in the context window."""
+    return estimate_tokens(SYSTEM_PROMPT) + estimate_tokens(prompt) + CHAT_TEMPLATE_TOKENS
+
+
+def chunk_token_budget() -> int:
+    """Diff tokens per chunk: LLM_CHUNK_TOKENS, limited by the prompt budget."""
+    instructions = prompt_tokens(build_review_prompt(""))
+    return max(1, min(LLM_CHUNK_TOKENS, LLM_PROMPT_TOKEN_BUDGET - instructions))
+
+
+def fit_prompt(diff_block: str) -> Tuple[str, int]:
+    """
+    Build the review prompt for diff_block, truncating the diff if the
+    prompt would exceed LLM_PROMPT_TOKEN_BUDGET. Returns (prompt, tokens).
+    """
+    prompt = build_review_prompt(diff_block)
+    used = prompt_tokens(prompt)
+    if used <= LLM_PROMPT_TOKEN_BUDGET:
+        return prompt, used
+
+    record_stat("prompts_truncated")
+    note = "\n```\n\n_(diff truncated to fit the prompt token budget)_"
+    room = LLM_PROMPT_TOKEN_BUDGET - (used - estimate_tokens(diff_block)) - estimate_tokens(note)
+    diff_block = get_token_counter().truncate(diff_block, max(0, room)) + note
+    prompt = build_review_prompt(diff_block)
+    return prompt, prompt_tokens(prompt)
+
+
+def parse_findings(text: str) -> List[Finding]:
+    """Extract the `[SEVERITY: ...]` findings from a review response."""
+    findings: List[Finding] = []
+    current: Optional[Finding] = None
+    details: List[str] = []
+
+    def flush() -> None:
+        if current is not None:
+            current.details = "\n".join(details).rstrip()
+            findings.append(current)
+
+    for line in text.splitlines():
+        m = _FINDING_RE.match(line)
+        if m:
+            flush()
+            current = Finding(severity=m.group(1), title=m.group(2).strip())
+            details = []
+        elif current is not None:
+            if line.strip() and not line[0].isspace():
+                # Unindented prose ends the finding's detail block
+                flush()
+                current = None
+            else:
+                details.append(line)
+    flush()
+
+    return findings
+
+
+def split_oversized_diffs(file_diffs: List[Tuple[str, str]], budget: int) -> List[Tuple[str, str]]:
+    """
+    Replace every file diff that would not fit in a chunk of budget tokens
+    by overlapping windows of it, each reviewed as its own request.
+    """
+    result: List[Tuple[str, str]] = []
+    for path, diff in file_diffs:
+        room = budget - estimate_tokens(format_file_diff(path, ""))
+        windows = split_file_diff(diff, room, estimate_tokens, LLM_SPLIT_OVERLAP_LINES)
+        if len(windows) > 1:
+            record_stat("split_files")
+            record_stat("split_windows", len(windows))
+        result.extend((path, window) for window in windows)
+    return result
+
+
+_PROJECT_DIRS: Dict[str, str] = {}
+
+
+def affinity_key(path: str) -> str:
+    """
+    Group key for packing: the directory of the nearest enclosing .csproj,
+    or the file's own directory when no project file encloses it.
+    """
+    directory = os.path.dirname(path.replace("\\", "/"))
+    root = current_run().cwd or os.getcwd()
+    cache_key = os.path.join(root, directory)
+    if cache_key in _PROJECT_DIRS:
+        return _PROJECT_DIRS[cache_key]
+
+    probe = directory
+    key = directory
+    while True:
+        try:
+            if any(name.endswith(".csproj") for name in os.listdir(os.path.join(root, probe))):
+                key = probe
+                break
+        except OSError:
+            pass
+        if not probe:
+            break
+        probe = os.path.dirname(probe)
+    _PROJECT_DIRS[cache_key] = key
+    return key
+
+
+def chunk_file_diffs(file_diffs: List[Tuple[str, str]], budget: int) -> List[List[Tuple[str, str]]]:
+    """
+    Pack file diffs into as few chunks of at most budget tokens as possible
+    (best-fit decreasing). Files of the same project or directory are placed
+    as a group so related changes are reviewed together; a group too large
+    for one chunk is packed file by file, preferring chunks that already
+    hold part of it. A single file larger than the budget gets its own
+    chunk. Within each chunk files keep their changed_files.txt order.
+    """
+    groups: Dict[str, List[Tuple[int, int]]] = {}
+    costs: List[int] = []
+    for index, (path, diff) in enumerate(file_diffs):
+        cost = estimate_tokens(format_file_diff(path, diff))
+        costs.append(cost)
+        groups.setdefault(affinity_key(path), []).append((index, cost))
+
+    # Each bin: [used tokens, member indexes, group keys]
+    bins: List[list] = []
+
+    def best_bin(cost: int, key: Optional[str] = None) -> Optional[list]:
+        fitting = [b for b in bins if b[0] + cost <= budget]
+        if not fitting:
+            return None
+        # Tightest fit, preferring bins that already hold this group
+        return min(fitting, key=lambda b: (key not in b[2], budget - b[0] - cost))
+
+    def place(items: List[Tuple[int, int]], key: str) -> None:
+        cost = sum(c for _, c in items)
+        target = best_bin(cost, key)
+        if target is None:
+            target = [0, [], set()]
+            bins.append(target)
+        target[0] += cost
+        target[1].extend(i for i, _ in items)
+        target[2].add(key)
+
+    ordered = sorted(groups.items(), key=lambda kv: -sum(c for _, c in kv[1]))
+    for key, items in ordered:
+        if sum(c for _, c in items) <= budget:
+            place(items, key)
+        else:
+            for item in sorted(items, key=lambda ic: -ic[1]):
+                place([item], key)
+
+    bins.sort(key=lambda b: min(b[1]))
+    if bins:
+        record_stat("review_requests", len(bins))
+        # An oversized file fills its own chunk but cannot overfill it
+        record_stat("pack_utilization", sum(min(c, budget) for c in costs) / (len(bins) * budget))
+    return [[file_diffs[i] for i in sorted(b[1])] for b in bins]
+
+
+# Static part of every review prompt. It always comes first and never
+# varies between requests, so servers with prefix (KV) caching can reuse
+# the prefill of system message + instructions across calls; only the
+# diffs after it have to be processed.
+REVIEW_INSTRUCTIONS = textwrap.dedent(
+    """\
+    You are performing a code review for a C# ASP.NET Core API project
+    and its CI/CD pipeline configuration.
+
+    Focus your review on:
+    - Correctness and potential bugs
+    - Security and input validation
+    - Performance, async, and resource usage
+    - Testability and maintainability
+    - CI/CD and Dockerfile/Jenkinsfile best practices
+
+    IMPORTANT:
+    - Ignore EF Core migration files; they were filtered out already.
+    - If the code looks reasonable overall, still highlight any potential risks or improvements.
+
+    For each issue, use this exact format:
+
+    - [SEVERITY: LOW|MEDIUM|HIGH] Short descriptive title
+      - File: <file-path>
+      - Description: <what is wrong and why it matters>
+      - Suggestion: <specific improvement or code change>
+
+    If there are no significant issues worth mentioning, write:
+    "No major issues found in the reviewed changes."
+
+    Review the following diffs between origin/main and the current branch:
+
+    """
+)
+
+
+def build_review_prompt(diff_block: str) -> str:
+    """Build the review prompt: the static instructions, then the diffs."""
+    return REVIEW_INSTRUCTIONS + diff_block + "\n"
+
+
+def format_llm_error(ex: Exception) -> str:
+    """Describe a failed LLM call for the report."""
+    return (
+        f"Error calling local CodeLLaMA at {', '.join(LLM_ENDPOINTS)}:\n\n"
+        f"{type(ex).__name__}: {ex}\n"
+    )
+
+
+def review_chunk(
+    chunk: List[Tuple[str, str]],
+    on_token: Optional[Callable[[str], None]] = None,
+    low_priority: bool = False,
+) -> str:
+    """
+    Review one chunk of file diffs; errors are returned as report text, and
+    a chunk the time budget did not cover as DEADLINE_NOTE.
+    """
+    if review_cancelled():
+        return TRUNCATED_NOTE
+    model = route_model(chunk)
+    remaining = remaining_time()
+    if remaining is not None:
+        near_deadline = low_priority and remaining < LLM_DEADLINE_DOWNGRADE_SECONDS
+        if remaining < LLM_DEADLINE_MIN_SECONDS or (near_deadline and not LLM_MODEL_SMALL):
+            record_stat("deadline_skipped")
+            return DEADLINE_NOTE
+        if near_deadline and model != LLM_MODEL_SMALL:
+            record_stat("deadline_downgraded")
+            model = LLM_MODEL_SMALL
+
+    diff_block = "\n\n".join(format_file_diff(p, d) for p, d in chunk)
+    prompt, used = fit_prompt(diff_block)
+    record_stat("prompt_tokens", used)
+    max_tokens = max(256, min(LLM_MAX_TOKENS, LLM_CONTEXT_TOKENS - used))
+    record_stat("route." + model)
+    try:
+        try:
+            review = call_llm(prompt, on_token, max_tokens, model)
+        except (ReviewCancelled, DeadlineExceeded):
+            raise
+        except Exception as ex:
+            # Nothing reached on_token if the request failed before output
+            if model == LLM_MODEL or not LLM_ROUTE_FALLBACK:
+                raise
+            print(f"{model} failed ({type(ex).__name__}: {ex}); falling back to {LLM_MODEL}.")
+            record_stat("route_fallbacks")
+            review = call_llm(prompt, on_token, max_tokens, LLM_MODEL)
+    except ReviewCancelled as ex:
+        # Keep only complete lines of the partial response
+        partial = ex.partial[:ex.partial.rfind("\n") + 1]
+        return (partial.rstrip() + "\n\n" + TRUNCATED_NOTE).lstrip()
+    except DeadlineExceeded:
+        record_stat("deadline_aborted")
+        return DEADLINE_NOTE
+    except Exception as ex:
+        return format_llm_error(ex)
+    if any(f.severity == "HIGH" for f in parse_findings(review)):
+        trigger_fail_fast("HIGH severity finding reported")
+    return review
+
+
+def _review_chunk_streamed(
+    index: int,
+    chunk: List[Tuple[str, str]],
+    report: Optional["StreamingReport"],
+    low_priority: bool = False,
+) -> str:
+    """Review one chunk, feeding its output to the live report if there is one."""
+    if report is None:
+        return review_chunk(chunk, low_priority=low_priority)
+    review = review_chunk(chunk, lambda text: report.on_token(index, text), low_priority)
+    report.on_done(index)
+    return review
+
+
+async def _review_chunks_async(
+    chunks: List[List[Tuple[str, str]]],
+    limit: int,
+    report: Optional["StreamingReport"] = None,
+    priorities: Optional[List[float]] = None,
+) -> List[str]:
+    """
+    Review all chunks with at most `limit` requests in flight, highest
+    priority first. The blocking HTTP calls run on a pool of `limit` worker
+    threads sharing the pooled session; results come back in chunk order and a failing chunk
+    only affects its own slot.
+    """
+    limit = max(1, limit)
+    semaphore = asyncio.Semaphore(limit)
+    order = schedule_order(priorities or [0.0] * len(chunks))
+    # The lower-priority half may be downgraded or skipped near the deadline
+    low = set(order[(len(order) + 1) // 2:])
+    loop = asyncio.get_running_loop()
+
+    # A pool of its own: the default executor (asyncio.to_thread) is capped
+    # at min(32, cpus + 4) threads, which would silently lower the limit
+    with ThreadPoolExecutor(max_workers=limit, thread_name_prefix="llm-review") as pool:
+
+        async def run(index: int) -> str:
+            async with semaphore:
+                return await loop.run_in_executor(
+                    pool, bind_run(_review_chunk_streamed), index, chunks[index], report, index in low
+                )
+
+        # Tasks queue on the (FIFO) semaphore in the order they are created
+        results = await asyncio.gather(*(run(i) for i in order), return_exceptions=True)
+    by_index = dict(zip(order, results))
+    return [
+        format_llm_error(r) if isinstance(r, BaseException) else r
+        for r in (by_index[i] for i in range(len(chunks)))
+    ]
+
+
+def review_chunks(
+    chunks: List[List[Tuple[str, str]]],
+    limit: Optional[int] = None,
+    report: Optional["StreamingReport"] = None,
+) -> List[str]:
+    """
+    Review chunks concurrently and return one review text per chunk. By
+    default as many requests are started as the adaptive limiter may allow;
+    it decides how many of them are actually sent at once.
+    """
+    if len(chunks) == 1:
+        return [_review_chunk_streamed(0, chunks[0], report)]
+    if limit is None:
+        limit = request_concurrency()
+    return asyncio.run(_review_chunks_async(chunks, limit, report, chunk_priorities(chunks)))
+
+
+def merge_reviews(
+    chunks: List[List[Tuple[str, str]]],
+    reviews: List[str],
+    cached: Optional[List[Finding]] = None,
+    reused_files: int = 0,
+) -> str:
+    """
+    Merge per-chunk reviews (plus findings reused from the finding cache)
+    into one report: findings are de-duplicated and ordered by severity, and
+    chunks that produced no parseable findings but did not report "no
+    issues" (errors, malformed output) are kept verbatim.
+    """
+    findings: List[Finding] = []
+    notes: List[str] = []
+
+    for index, (chunk, review) in enumerate(zip(chunks, reviews), start=1):
+        parsed = parse_findings(review)
+        if review_incomplete(review):
+            # Never started (or cut off) by fail-fast or the time budget;
+            # deadline parts are listed separately in the report. Complete
+            # findings of a cut-off part (such as the HIGH that triggered
+            # fail-fast) still count.
+            findings.extend(parsed)
+            continue
+        if not parsed and not is_clean_review(review):
+            files = ", ".join(p for p, _ in chunk)
+            notes.append(f"### Part {index} ({files})\n\n{review.strip()}")
+        findings.extend(parsed)
+    findings = dedupe_findings(findings + list(cached or []))
+
+    if reused_files:
+        summary = (
+            f"_Reviewed {len(chunks)} part(s) of the diff and reused findings for "
+            f"{reused_files} unchanged file(s) from earlier builds; findings are merged below._"
+        )
+    elif chunks:
+        summary = f"_The diff was reviewed in {len(chunks)} parts; findings are merged below._"
+    else:
+        summary = ""
+    parts = [summary] if summary else []
+    skipped_all = bool(reviews) and all(review_incomplete(r) for r in reviews)
+    if findings:
+        parts.append("\n".join(f.render() for f in findings))
+    elif not notes and not skipped_all:
+        parts.append(NO_ISSUES_TEXT)
+    if notes:
+        parts.append("## Unmerged output\n\n" + "\n\n".join(notes))
+    return "\n\n".join(parts)
+
+
+def dedupe_findings(findings: List[Finding]) -> List[Finding]:
+    """Drop repeated findings and order the rest by severity (stable)."""
+    result: List[Finding] = []
+    seen = set()
+    for f in findings:
+        key = (f.severity, f.title.lower(), f.file)
+        if key not in seen:
+            seen.add(key)
+            result.append(f)
+    result.sort(key=lambda f: SEVERITY_ORDER[f.severity])
+    return result
+
+
+def is_clean_review(review: str) -> bool:
+    """True if the review explicitly reports that there are no issues."""
+    return NO_ISSUES_TEXT.rstrip(".") in review
+
+
+# ---------------------------------------------------------------------------
+# Streaming report
+# ---------------------------------------------------------------------------
+
+class FindingStream:
+    """
+    Incremental finding parser for streamed text: each finding is passed to
+    on_finding as soon as the line after its detail block has arrived.
+    """
+
+    def __init__(self, on_finding: Callable[[Finding], None]):
+        self.on_finding = on_finding
+        self._partial = ""
+        self._lines: List[str] = []
+
+    def feed(self, text: str) -> None:
+        self._partial += text
+        while "\n" in self._partial:
+            line, self._partial = self._partial.split("\n", 1)
+            self._line(line)
+
+    def close(self) -> None:
+        if self._partial:
+            self._line(self._partial)
+            self._partial = ""
+        self._emit()
+
+    def _line(self, line: str) -> None:
+        if _FINDING_RE.match(line):
+            self._emit()
+            self._lines = [line]
+        elif self._lines:
+            if line.strip() and not line[0].isspace():
+                self._emit()
+            else:
+                self._lines.append(line)
+
+    def _emit(self) -> None:
+        if self._lines:
+            for finding in parse_findings("\n".join(self._lines)):
+                self.on_finding(finding)
+            self._lines = []
+
+
+class StreamingReport:
+    """
+    Writes the review into the report file while it is being generated.
+
+    With a single review request (raw=True) tokens are written as they
+    arrive; with several concurrent requests each finding is appended once
+    it is complete. main() rewrites the file with the final merged report.
+    """
+
+    def __init__(self, path: str, chunk_count: int, raw: bool):
+        self._out = open(path, "w", encoding="utf-8")
+        self._out.write("# LLM Code Review (CodeLLaMA)\n\n")
+        self._out.flush()
+        self._raw = raw
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._first_finding = True
+        self._streams = [FindingStream(self._on_finding) for _ in range(chunk_count)]
+
+    def on_token(self, index: int, text: str) -> None:
+        with self._lock:
+            if self._raw:
+                self._out.write(text)
+                self._out.flush()
+            self._streams[index].feed(text)
+
+    def on_done(self, index: int) -> None:
+        with self._lock:
+            self._streams[index].close()
+
+    def _on_finding(self, finding: Finding) -> None:
+        # Called with self._lock held
+        if self._first_finding:
+            self._first_finding = False
+            record_stat("time_to_first_finding_s", time.monotonic() - self._started)
+        record_stat("streamed_findings")
+        if finding.severity == "HIGH":
+            trigger_fail_fast(f"HIGH severity finding streamed: {finding.title}")
+        if not self._raw:
+            self._out.write(finding.render() + "\n")
+            self._out.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._out.close()
+
+
+# ---------------------------------------------------------------------------
+# Finding cache
+# ---------------------------------------------------------------------------
+
+_INSTRUCTIONS_ID: Optional[str] = None
+
+
+def get_finding_cache():
+    """
+    Return the per-file finding cache (a FindingCache or, with the git-notes
+    backend, a GitNotesFindingCache), or None when it is disabled.
+    """
+    run = current_run()
+    if run.finding_cache is None and LLM_FINDING_CACHE:
+        if LLM_FINDING_CACHE_BACKEND == "git-notes":
+            run.finding_cache = GitNotesFindingCache(LLM_NOTES_REF, LLM_NOTES_REMOTE, run.cwd)
+            if not run.finding_cache.pull():
+                print(f"Could not fetch {LLM_NOTES_REF} from {LLM_NOTES_REMOTE}; using local notes only.")
+        elif LLM_CACHE_DIR:
+            run.finding_cache = FindingCache(LLM_CACHE_DIR)
+    return run.finding_cache
+
+
+def publish_finding_cache() -> None:
+    """Push new git-notes findings so other agents can reuse them."""
+    cache = current_run().finding_cache
+    if isinstance(cache, GitNotesFindingCache) and cache.dirty and LLM_NOTES_PUSH:
+        if not cache.push():
+            print(f"Could not push {LLM_NOTES_REF} to {LLM_NOTES_REMOTE}.")
+
+
+def finding_cache_key(path: str, diff: str) -> str:
+    """
+    Key for one file diff's findings. Besides the patch ID it covers the
+    model(s) and review instructions, which also decide what gets reported.
+    """
+    global _INSTRUCTIONS_ID
+    if _INSTRUCTIONS_ID is None:
+        _INSTRUCTIONS_ID = content_key(SYSTEM_PROMPT, build_review_prompt(""))
+    return content_key("findings", routing_id(), _INSTRUCTIONS_ID, path, stable_patch_id(diff))
+
+
+def _finding_matches(finding: Finding, path: str) -> bool:
+    """True if a finding's `File:` line refers to path."""
+    name = finding.file.replace("\\", "/").lstrip("./")
+    norm = path.replace("\\", "/")
+    return bool(name) and (name == norm or norm.endswith("/" + name) or name.endswith("/" + norm))
+
+
+def apply_finding_cache(
+    file_diffs: List[Tuple[str, str]],
+) -> Tuple[List[Tuple[str, str]], List[Finding], int]:
+    """
+    Split file diffs into those that still need a review and findings
+    cached for the rest. Returns (to_review, cached_findings, reused_files).
+    """
+    cache = get_finding_cache()
+    if cache is None:
+        return file_diffs, [], 0
+
+    to_review: List[Tuple[str, str]] = []
+    cached: List[Finding] = []
+    reused = 0
+    for path, diff in file_diffs:
+        entry = cache.get(finding_cache_key(path, diff))
+        if entry is None:
+            record_stat("finding_cache_misses")
+            to_review.append((path, diff))
+            continue
+        record_stat("finding_cache_hits")
+        reused += 1
+        cached.extend(Finding(**f) for f in entry)
+    return to_review, cached, reused
+
+
+def store_chunk_findings(chunk: List[Tuple[str, str]], review: str) -> None:
+    """
+    Cache a chunk's findings per file. Findings that name no file of the
+    chunk are kept with every file in it; reviews that are neither clean nor
+    parseable (errors, malformed output) are not cached.
+    """
+    cache = get_finding_cache()
+    if cache is None:
+        return
+    findings = parse_findings(review)
+    if TRUNCATED_NOTE in review or (not findings and not is_clean_review(review)):
+        return
+
+    unattributed = [f for f in findings if not any(_finding_matches(f, p) for p, _ in chunk)]
+    for path, diff in chunk:
+        own = [f for f in findings if _finding_matches(f, path)] + unattributed
+        cache.put(finding_cache_key(path, diff), [asdict(f) for f in own])
+
+
+# ---------------------------------------------------------------------------
+# Incremental review
+# ---------------------------------------------------------------------------
+
+def git_rev_parse(rev: str) -> Optional[str]:
+    """Resolve rev to a full SHA, or None if it does not exist."""
+    try:
+        out = subprocess.check_output(
+            ["git", "rev-parse", "--verify", "--quiet", rev + "^{commit}"],
+            text=True,
+            stderr=subprocess.DEVNULL,
+            cwd=current_run().cwd,
+        )
+    except (subprocess.CalledProcessError, OSError):
+        return None
+    return out.strip() or None
+
+
+def is_ancestor(ancestor: str, rev: str) -> bool:
+    """True if ancestor is reachable from rev (history was not rewritten)."""
+    return subprocess.call(
+        ["git", "merge-base", "--is-ancestor", ancestor, rev],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        cwd=current_run().cwd,
+    ) == 0
+
+
+def current_branch() -> str:
+    """Branch being built: Jenkins' BRANCH_NAME/GIT_BRANCH, else git's view."""
+    for var in ("BRANCH_NAME", "GIT_BRANCH"):
+        if run_env(var):
+            return run_env(var)
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--abbrev-ref", "HEAD"],
+            text=True,
+            stderr=subprocess.DEVNULL,
+            cwd=current_run().cwd,
+        ).strip()
+    except (subprocess.CalledProcessError, OSError):
+        return "HEAD"
+
+
+def repository_id() -> str:
+    """This repository's origin URL (its directory when it has no origin)."""
+    try:
+        origin = subprocess.check_output(
+            ["git", "config", "--get", "remote.origin.url"],
+            text=True,
+            stderr=subprocess.DEVNULL,
+            cwd=current_run().cwd,
+        ).strip()
+    except (subprocess.CalledProcessError, OSError):
+        origin = ""
+    return origin or current_run().cwd or os.getcwd()
+
+
+def _review_state_path(branch: str) -> str:
+    """State file for branch, scoped to this repository's origin URL."""
+    return os.path.join(LLM_STATE_DIR, content_key(repository_id(), branch) + ".json")
+
+
+def load_review_state(branch: str) -> Dict:
+    """Last reviewed SHA and findings for branch ({} if never reviewed)."""
+    state = read_json(_review_state_path(branch))
+    return state if isinstance(state, dict) else {}
+
+
+def save_review_state(branch: str, sha: str, findings: List[Finding]) -> None:
+    """Record sha as reviewed for branch along with its accumulated findings."""
+    try:
+        atomic_write_json(
+            _review_state_path(branch),
+            {"branch": branch, "sha": sha, "findings": [asdict(f) for f in findings]},
+        )
+    except OSError as ex:
+        print(f"Could not save incremental review state: {ex}")
+
+
+def incremental_base(state: Dict, head: str) -> Tuple[Optional[str], List[Finding]]:
+    """
+    Pick the base for an incremental review: the last reviewed SHA if HEAD
+    still descends from it, else None (full review against origin/main).
+    Returns the base and the findings to carry forward from it.
+    """
+    last = state.get("sha")
+    if not last:
+        return None, []
+    if git_rev_parse(last) is None or not is_ancestor(last, head):
+        print(f"History was rewritten since {last[:12]}; running a full review.")
+        return None, []
+    previous = [Finding(**f) for f in state.get("findings", [])]
+    return last, previous
+
+
+def carried_forward(previous: List[Finding], changed: List[str], unreviewed: List[str]) -> List[Finding]:
+    """
+    Earlier findings that still apply: those on files outside `changed`, or
+    on changed files left (partly) unreviewed. Files in `changed` were
+    reviewed again in full, so their old findings are superseded by the
+    new ones.
+    """
+    kept = set(unreviewed)
+    superseded = [p for p in changed if p not in kept]
+    return [f for f in previous if not any(_finding_matches(f, p) for p in superseded)]
+
+
+def changed_paths_since(base: str) -> List[str]:
+    """Paths changed between base and HEAD."""
+    try:
+        out = subprocess.check_output(
+            ["git", "-c", "core.quotePath=false", "diff", "--name-only", base, "HEAD"],
+            text=True,
+            stderr=subprocess.DEVNULL,
+            cwd=current_run().cwd,
+        )
+    except (subprocess.CalledProcessError, OSError):
+        return []
+    return [line for line in out.splitlines() if line]
+
+
+# ---------------------------------------------------------------------------
+# Main
+# ---------------------------------------------------------------------------
+
+def reset_run_state() -> None:
+    """
+    Clear per-run state (statistics, fail-fast flag, circuit breaker,
+    repository-bound caches) so a daemon can run many reviews in one process.
+    """
+    run = current_run()
+    run.stats.clear()
+    run.cancelled.clear()
+    run.breaker = CircuitBreaker(LLM_CIRCUIT_THRESHOLD)
+    run.session_baseline = _session_counters()
+    run.finding_cache = None
+
+
+def run_review(changed_files_path: str, output_path: str) -> int:
+    """
+    Review the changed files of the repository in the current directory and
+    write the markdown report. Returns the process exit code.
+    """
+    reset_run_state()
+    start_deadline()
+
+    # 1. Read changed files
+    all_files = read_changed_files(changed_files_path)
+
+    # 2. Filter out EF Core migrations
+    files = filter_out_migrations(all_files)
+
+    if not files:
+        with open(output_path, "w", encoding="utf-8") as out:
+            out.write(
+                "No non-migration files to review. "
+                "EF Core migration files were intentionally ignored.\n"
+            )
+        return 0
+
+    # Incremental mode: only look at what was pushed since the last review
+    branch = current_branch()
+    head = git_rev_parse("HEAD")
+    base: Optional[str] = None
+    previous: List[Finding] = []
+    pushed: List[str] = []
+    diff_base: Optional[str] = None
+    if LLM_INCREMENTAL and head:
+        base, previous = incremental_base(load_review_state(branch), head)
+        if base:
+            pushed = changed_paths_since(base)
+            files = [f for f in files if f in set(pushed)]
+            # Review the pushed files in full so their new findings replace
+            # all old ones; without a merge-base only the pushed part can be
+            # reviewed, and the old findings on those files are kept
+            diff_base = get_merge_base()
+            if diff_base is None:
+                diff_base = base
+                pushed = []
+
+    # 3. Collect per-file diffs and split them into review-sized chunks
+    file_diffs = collect_file_diffs(files, diff_base)
+
+    if not file_diffs and not base:
+        with open(output_path, "w", encoding="utf-8") as out:
+            out.write("No diffs to review for the filtered file set.\n")
+        return 0
+
+    # Split single files too large for one request, then reuse findings for
+    # file diffs already reviewed by an earlier build
+    budget = chunk_token_budget()
+    file_diffs = split_oversized_diffs(file_diffs, budget)
+    to_review, cached_findings, reused_files = apply_finding_cache(file_diffs)
+    chunks = chunk_file_diffs(to_review, budget)
+
+    # 4. Review the chunks concurrently with local CodeLLaMA
+    report = None
+    if LLM_STREAM and chunks:
+        raw = len(chunks) == 1 and not reused_files and not base
+        report = StreamingReport(output_path, len(chunks), raw)
+    try:
+        reviews = review_chunks(chunks, report=report) if chunks else []
+    finally:
+        if report is not None:
+            report.close()
+    for chunk, review in zip(chunks, reviews):
+        store_chunk_findings(chunk, review)
+    if LLM_RISK:
+        record_high_findings([f for r in reviews for f in parse_findings(r)])
+
+    # Files left out by fail-fast or the time budget keep their old findings
+    skipped_paths = [
+        path
+        for chunk, review in zip(chunks, reviews)
+        if review_incomplete(review)
+        for path, _diff in chunk
+    ]
+    previous = carried_forward(previous, pushed, skipped_paths)
+
+    # 5. Merge per-chunk findings into one review
+    if len(chunks) == 1 and not reused_files and not base:
+        review_text = reviews[0]
+    else:
+        review_text = merge_reviews(chunks, reviews, previous + cached_findings, reused_files)
+    if base:
+        review_text = (
+            f"_Incremental review of {base[:12]}..{head[:12]}; "
+            f"{len(previous)} earlier finding(s) carried forward._\n\n" + review_text
+        )
+
+    if review_cancelled():
+        skipped = sum(1 for r in reviews if TRUNCATED_NOTE in r)
+        review_text = (
+            "**Review truncated (fail-fast):** stopped at the first HIGH severity "
+            f"finding; {skipped} of {len(chunks)} part(s) were not reviewed.\n\n" + review_text
+        )
+
+    unreviewed = unreviewed_files(chunks, reviews)
+    if unreviewed:
+        budget_seconds = float(run_env("LLM_DEADLINE_SECONDS", str(LLM_DEADLINE_SECONDS)))
+        skipped = sum(1 for r in reviews if r == DEADLINE_NOTE)
+        parts = [
+            f"**Review incomplete (time budget):** {skipped} of {len(chunks)} part(s) "
+            f"were not reviewed within {budget_seconds:g}s; see the list below."
+        ]
+        if review_text.strip() != DEADLINE_NOTE:
+            parts.append(review_text)
+        parts.append("## Not reviewed (time budget)\n\n" + "\n".join(f"- {p}" for p in unreviewed))
+        review_text = "\n\n".join(parts)
+
+    if current_run().abandoned.is_set():
+        # The build has moved on; its workspace may already belong to another
+        print("Client disconnected; review abandoned without writing a report.")
+        return 1
+
+    if LLM_INCREMENTAL and head and not review_cancelled() and all(parse_findings(r) or is_clean_review(r) for r in reviews):
+        new_findings = [f for r in reviews for f in parse_findings(r)]
+        save_review_state(branch, head, dedupe_findings(previous + cached_findings + new_findings))
+
+    # 6. Write markdown report
+    with open(output_path, "w", encoding="utf-8") as out:
+        out.write("# LLM Code Review (CodeLLaMA)\n\n")
+        out.write(review_text)
+        out.write("\n")
+
+    publish_finding_cache()
+    prune_caches()
+    print_run_stats()
+
+    return FAIL_FAST_EXIT_CODE if review_cancelled() else 0
+
+
+# ---------------------------------------------------------------------------
+# Entry point
+# ---------------------------------------------------------------------------
+
+def main() -> None:
+    if len(sys.argv) >= 2 and sys.argv[1] == "--serve":
+        serve(run_review, sys.argv[2] if len(sys.argv) > 2 else LLM_REVIEW_SOCKET, get_session)
+        return
+
+    if len(sys.argv) != 3:
+        print("Usage: llm_review.py <changed_files.txt> <output.md>")
+        print("       llm_review.py --serve [socket-path]")
+        sys.exit(1)
+
+    code = run_review(sys.argv[1], sys.argv[2])
+    if code:
+        sys.exit(code)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Thin client for the LLM code review daemon (llm_review.py --serve)
+
+- Sends the review job for the current repository over the daemon's Unix
+  socket (LLM_REVIEW_SOCKET, default /tmp/llm-review-<uid>/llm-review.sock)
+  and waits for it to finish
+- Prints the daemon's log for the job and exits with the review's exit code
+- Gives up after LLM_REVIEW_TIMEOUT seconds (default: the review's
+  LLM_DEADLINE_SECONDS plus a minute); the daemon then drops the job and
+  the report says the review ran out of time, as a deadline stop does
+- Falls back to running llm_review.py in-process when no daemon is running
+  or the daemon was started with different LLM_* settings, so builds
+  behave the same with or without one
+
+Usage:
+    llm_review_client.py <changed_files.txt> <output.md>
+"""
+
+import json
+import os
+import socket
+import sys
+import time
+
+from review_daemon import LLM_REVIEW_SOCKET as SOCKET_PATH
+
+# Job environment forwarded to the daemon: the branch and every LLM_*
+# setting (see review_daemon.FORWARDED_ENV for which ones apply per job)
+FORWARDED_ENV = ("BRANCH_NAME", "GIT_BRANCH")
+
+# Seconds to wait for the daemon's result (0 = no limit). Defaults to the
+# review's own time budget plus a minute for the report and slack.
+_DEADLINE = float(os.environ.get("LLM_DEADLINE_SECONDS", "0") or 0)
+LLM_REVIEW_TIMEOUT = float(os.environ.get("LLM_REVIEW_TIMEOUT", str(_DEADLINE + 60 if _DEADLINE > 0 else 0)))
+
+# Seconds to wait for the daemon to accept the connection
+CONNECT_TIMEOUT = 10.0
+
+
+class ReviewTimeout(Exception):
+    """The daemon accepted the job but did not answer within LLM_REVIEW_TIMEOUT."""
+
+
+def submit(changed_files: str, output: str) -> int:
+    """
+    Submit one job to the daemon; raises OSError if it is unreachable or
+    the socket belongs to another user (anyone could be listening there).
+    """
+    if os.stat(SOCKET_PATH).st_uid != os.getuid():
+        raise OSError(f"{SOCKET_PATH} is not owned by this user")
+    job = {
+        "cwd": os.getcwd(),
+        "changed_files": os.path.abspath(changed_files),
+        "output": os.path.abspath(output),
+        "env": {k: v for k, v in os.environ.items() if k in FORWARDED_ENV or k.startswith("LLM_")},
+        # The daemon charges time spent before the job starts to its budget
+        "submitted": time.time(),
+    }
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(CONNECT_TIMEOUT)
+        sock.connect(SOCKET_PATH)
+        sock.settimeout(LLM_REVIEW_TIMEOUT or None)
+        sock.sendall((json.dumps(job) + "\n").encode("utf-8"))
+        try:
+            with sock.makefile("rb") as reply:
+                line = reply.readline()
+        except socket.timeout:
+            raise ReviewTimeout(f"no result from the review daemon within {LLM_REVIEW_TIMEOUT:g}s")
+    if not line:
+        raise OSError("review daemon closed the connection without a result")
+
+    result = json.loads(line)
+    if "rejected" in result:
+        raise OSError(result["rejected"])
+    sys.stdout.write(result.get("log", ""))
+    return int(result.get("exit_code", 1))
+
+
+def write_timeout_report(changed_files: str, output: str) -> None:
+    """Write the report of a job the daemon did not finish in time."""
+    try:
+        with open(changed_files, encoding="utf-8") as f:
+            paths = [line.strip() for line in f if line.strip()]
+    except OSError:
+        paths = []
+    with open(output, "w", encoding="utf-8") as out:
+        out.write("# LLM Code Review (CodeLLaMA)\n\n")
+        out.write(
+            "**Review incomplete (time budget):** the review daemon did not return a "
+            f"result within {LLM_REVIEW_TIMEOUT:g}s; nothing was reviewed.\n"
+        )
+        if paths:
+            out.write("\n## Not reviewed (time budget)\n\n")
+            out.write("".join(f"- `{p}`\n" for p in paths))
+
+
+def main() -> None:
+    if len(sys.argv) != 3:
+        print("Usage: llm_review_client.py <changed_files.txt> <output.md>")
+        sys.exit(1)
+
+    try:
+        code = submit(sys.argv[1], sys.argv[2])
+    except ReviewTimeout as ex:
+        # Running the review again directly would only take longer still.
+        # Closing the socket makes the daemon abandon the job; report it
+        # like a review that ran out of time.
+        print(f"LLM review incomplete: {ex}")
+        write_timeout_report(sys.argv[1], sys.argv[2])
+        sys.exit(0)
+    except OSError as ex:
+        print(f"LLM review daemon at {SOCKET_PATH} not used ({ex}); running review directly.")
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "llm_review.py")
+        sys.stdout.flush()
+        os.execv(sys.executable, [sys.executable, script, sys.argv[1], sys.argv[2]])
+    sys.exit(code)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Retry and circuit-breaker helpers for LLM requests.
+
+Transient failures (connection resets while the model reloads, timeouts,
+429 and 5xx responses) are retried a bounded number of times with capped
+exponential backoff and full jitter, honouring the server's Retry-After
+header when it sends one. A CircuitBreaker counts consecutive failures
+across all requests of a run; once it opens, further calls fail at once
+instead of each waiting out its own timeout against a server that is down.
+"""
+
+import email.utils
+import random
+import threading
+import time
+from typing import Optional
+
+import requests
+
+# HTTP statuses worth retrying: rate limited, or the server/gateway is busy
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of sending a request once the circuit breaker is open."""
+
+
+def is_retryable(ex: BaseException) -> bool:
+    """Whether a failed request may succeed if sent again."""
+    if isinstance(ex, requests.exceptions.HTTPError):
+        return ex.response is not None and ex.response.status_code in RETRYABLE_STATUSES
+    return isinstance(ex, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+
+def retry_after_seconds(ex: BaseException) -> Optional[float]:
+    """The delay requested by a Retry-After header (seconds or HTTP date), if any."""
+    response = getattr(ex, "response", None)
+    if response is None:
+        return None
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Full-jitter exponential backoff before retry number `attempt` (from 0)."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failures and stays open until
+    reset(); any success in between closes the count again.
+    """
+
+    def __init__(self, threshold: int):
+        self.threshold = threshold
+        self.failures = 0
+        self.opened_reason: Optional[str] = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_reason is not None
+
+    def check(self) -> None:
+        """Raise CircuitOpenError if the breaker is open."""
+        if self.opened_reason is not None:
+            raise CircuitOpenError(f"LLM endpoint considered down ({self.opened_reason})")
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+
+    def record_failure(self, ex: BaseException) -> bool:
+        """Count a failure; returns True if this one opened the breaker."""
+        with self._lock:
+            self.failures += 1
+            if self.threshold > 0 and self.failures >= self.threshold and self.opened_reason is None:
+                self.opened_reason = f"{self.failures} consecutive failures, last: {type(ex).__name__}"
+                return True
+            return False
+
+    def reset(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_reason = None
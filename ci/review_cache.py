@@ -0,0 +1,363 @@
+"""
+On-disk caches for the LLM code review.
+
+ResponseCache stores LLM responses under a content hash of the request, so
+re-running a build on the same commit does not send identical prompts to
+the model again. Entries are written atomically (temp file + rename) and the
+directory is trimmed back to a size limit by evicting the least recently
+used entries, which makes it safe to share between concurrent builds on
+one Jenkins agent.
+
+FindingCache stores the review findings for individual file diffs, keyed on
+a patch ID that survives rebases, so only diffs that actually changed since
+an earlier build have to go back to the LLM. GitNotesFindingCache is an
+alternative backend that keeps those findings in git notes, shared between
+agents through the remote.
+"""
+
+import hashlib
+import json
+import os
+import re
+import subprocess
+import tempfile
+from typing import Any, Dict, Iterator, List, Optional
+
+
+def content_key(*parts: Any) -> str:
+    """Stable SHA-256 key over JSON-serialisable request parts."""
+    blob = json.dumps(parts, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+# Diff lines that change with the base commit but not with the patch itself
+_UNSTABLE_PREFIXES = ("index ", "@@", "similarity index ", "dissimilarity index ")
+
+
+def stable_patch_id(diff: str) -> str:
+    """
+    Fingerprint one file diff the way `git patch-id --stable` does: blob
+    hashes and hunk line numbers are ignored and whitespace is stripped, so
+    the same change rebased onto a newer origin/main keeps its ID.
+    """
+    h = hashlib.sha1()
+    for line in diff.splitlines():
+        if line.startswith(_UNSTABLE_PREFIXES):
+            continue
+        h.update(_WHITESPACE_RE.sub("", line).encode("utf-8"))
+        h.update(b"\n")
+    return h.hexdigest()
+
+
+def atomic_write_json(path: str, data: Any) -> None:
+    """Write JSON to path so readers never observe a partially written file."""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".json")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def read_json(path: str) -> Optional[Any]:
+    """Read a JSON file, treating missing or corrupt files as absent."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def prune_lru(directories: List[str], max_bytes: int) -> int:
+    """
+    Evict the least recently used files across `directories` until their
+    combined size fits in max_bytes. Returns the number of files removed.
+    """
+    entries = []
+    total = 0
+    for directory in directories:
+        for root, _dirs, names in os.walk(directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+
+    removed = 0
+    entries.sort()
+    for _mtime, size, path in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.unlink(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    return removed
+
+
+class ResponseCache:
+    """
+    Content-addressed cache of LLM responses in `directory`. The file mtime
+    is bumped on every hit so prune_lru() evicts least recently used first.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = os.path.join(directory, "responses")
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached response for key, or None on a miss."""
+        path = self._path(key)
+        entry = read_json(path)
+        if not isinstance(entry, dict) or "content" not in entry:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            # Evicted by another build in the meantime; the content is still good
+            pass
+        return entry["content"]
+
+    def put(self, key: str, content: str, meta: Optional[Dict[str, Any]] = None) -> None:
+        """Store a response; failures to write are not fatal for the review."""
+        entry = dict(meta or {})
+        entry["content"] = content
+        try:
+            atomic_write_json(self._path(key), entry)
+        except OSError:
+            pass
+
+
+class FindingCache:
+    """
+    Review findings per file diff, stored as JSON lists of finding dicts in
+    `directory`. An empty list records a diff that was reviewed clean.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = os.path.join(directory, "findings")
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def get(self, key: str) -> Optional[List[Dict[str, str]]]:
+        """Return cached findings for key, or None if it was never reviewed."""
+        path = self._path(key)
+        entry = read_json(path)
+        if not isinstance(entry, list):
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry
+
+    def put(self, key: str, findings: List[Dict[str, str]]) -> None:
+        """Store findings for key; failures to write are not fatal."""
+        try:
+            atomic_write_json(self._path(key), findings)
+        except OSError:
+            pass
+
+
+class GitNotesFindingCache:
+    """
+    FindingCache backend that stores findings as git notes under `ref`, so
+    every agent that fetches the ref shares earlier review results.
+
+    Each cache key is anchored to a small blob ("llm-review:<key>") and the
+    note on that blob holds one compact JSON array per finding line
+    (`[severity, title, details]`; `[]` marks a clean review). Because each
+    line is self-contained, concurrent writers are reconciled with git's
+    cat_sort_uniq notes merge, which unions the lines of conflicting notes.
+    """
+
+    IDENTITY = ["-c", "user.name=llm-review", "-c", "user.email=llm-review@localhost"]
+
+    def __init__(self, ref: str = "refs/notes/llm-review", remote: str = "origin", cwd: Optional[str] = None):
+        self.ref = ref
+        self.remote = remote
+        # Repository the notes live in (None: the current directory)
+        self.cwd = cwd
+        self.dirty = False
+        self._notes: Optional[Dict[str, str]] = None
+        self._object_format: Optional[str] = None
+
+    # -- git plumbing -------------------------------------------------------
+
+    def _git(self, *args: str, stdin: Optional[str] = None) -> str:
+        return subprocess.run(
+            ["git", *args],
+            input=stdin,
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=self.cwd,
+        ).stdout
+
+    def _anchor_text(self, key: str) -> str:
+        return f"llm-review:{key}\n"
+
+    def _remote_tracking_ref(self) -> str:
+        return self.ref + "-remote"
+
+    def _load(self) -> Dict[str, str]:
+        """Read every note under the ref in one `git cat-file --batch` call."""
+        if self._notes is not None:
+            return self._notes
+        self._notes = {}
+        try:
+            listing = self._git("notes", f"--ref={self.ref}", "list")
+        except (subprocess.CalledProcessError, OSError):
+            return self._notes
+
+        pairs = [line.split() for line in listing.splitlines() if line.strip()]
+        if not pairs:
+            return self._notes
+        try:
+            out = subprocess.run(
+                ["git", "cat-file", "--batch"],
+                input="".join(note + "\n" for note, _obj in pairs).encode(),
+                capture_output=True,
+                check=False,
+                cwd=self.cwd,
+            ).stdout
+        except OSError:
+            return self._notes
+
+        pos = 0
+        for _note, obj in pairs:
+            end = out.find(b"\n", pos)
+            if end < 0:
+                # Output cut short: keep the notes read so far
+                break
+            header = out[pos:end].split()
+            pos = end + 1
+            if len(header) < 3 or not header[2].isdigit():
+                continue
+            size = int(header[2])
+            self._notes[obj] = out[pos:pos + size].decode("utf-8", "replace")
+            pos += size + 1
+        return self._notes
+
+    def _anchor_id(self, key: str) -> str:
+        """Object ID of the anchor blob, computed the way git hashes blobs."""
+        if self._object_format is None:
+            try:
+                self._object_format = self._git("rev-parse", "--show-object-format").strip() or "sha1"
+            except (subprocess.CalledProcessError, OSError):
+                self._object_format = "sha1"
+        data = self._anchor_text(key).encode("utf-8")
+        h = hashlib.new(self._object_format)
+        h.update(b"blob %d\0" % len(data))
+        h.update(data)
+        return h.hexdigest()
+
+    # -- FindingCache interface --------------------------------------------
+
+    def get(self, key: str) -> Optional[List[Dict[str, str]]]:
+        """Return cached findings for key, or None if it was never reviewed."""
+        notes = self._load()
+        if not notes:
+            return None
+        anchor = self._anchor_id(key)
+        if anchor not in notes:
+            return None
+
+        findings: List[Dict[str, str]] = []
+        seen = set()
+        for line in notes[anchor].splitlines():
+            try:
+                item = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(item, list) and len(item) == 3 and line not in seen:
+                seen.add(line)
+                findings.append({"severity": item[0], "title": item[1], "details": item[2]})
+        return findings
+
+    def put(self, key: str, findings: List[Dict[str, str]]) -> None:
+        """Attach findings to key's anchor blob as a note (best effort)."""
+        lines = [
+            json.dumps([f["severity"], f["title"], f["details"]], ensure_ascii=False, separators=(",", ":"))
+            for f in findings
+        ] or ["[]"]
+        text = "\n".join(lines) + "\n"
+        try:
+            anchor = self._git("hash-object", "-w", "--stdin", stdin=self._anchor_text(key)).strip()
+            self._git(*self.IDENTITY, "notes", f"--ref={self.ref}", "add", "-f", "-F", "-", anchor, stdin=text)
+        except (subprocess.CalledProcessError, OSError):
+            return
+        self._load()[anchor] = text
+        self.dirty = True
+
+    def all_findings(self) -> Iterator[List[Dict[str, str]]]:
+        """Every findings list stored in the notes (for history statistics)."""
+        for text in self._load().values():
+            findings = []
+            for line in text.splitlines():
+                try:
+                    item = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(item, list) and len(item) == 3:
+                    findings.append({"severity": item[0], "title": item[1], "details": item[2]})
+            yield findings
+
+    # -- sharing ------------------------------------------------------------
+
+    def pull(self) -> bool:
+        """Fetch the remote notes ref and merge it into the local one."""
+        tracking = self._remote_tracking_ref()
+        try:
+            self._git("fetch", "--quiet", self.remote, f"+{self.ref}:{tracking}")
+        except (subprocess.CalledProcessError, OSError):
+            return False
+        try:
+            self._git("rev-parse", "--verify", "--quiet", self.ref)
+        except subprocess.CalledProcessError:
+            try:
+                self._git("update-ref", self.ref, tracking)
+            except (subprocess.CalledProcessError, OSError):
+                return False
+        except OSError:
+            return False
+        else:
+            try:
+                self._git(*self.IDENTITY, "notes", f"--ref={self.ref}", "merge", "--quiet",
+                          "-s", "cat_sort_uniq", tracking)
+            except (subprocess.CalledProcessError, OSError):
+                return False
+        self._notes = None
+        return True
+
+    def push(self, attempts: int = 3) -> bool:
+        """
+        Push the notes ref. A rejected push means another agent pushed first:
+        merge its notes and retry.
+        """
+        for _ in range(attempts):
+            try:
+                self._git("push", "--quiet", self.remote, f"{self.ref}:{self.ref}")
+                self.dirty = False
+                return True
+            except (subprocess.CalledProcessError, OSError):
+                if not self.pull():
+                    return False
+        return False
@@ -0,0 +1,291 @@
+"""
+Review daemon for llm_review.py: per-run state and the Unix socket server.
+
+llm_review.py --serve keeps one process (with its HTTP session, limiters
+and caches) warm between builds and runs each job that
+llm_review_client.py submits in its own RunState. Reviews run concurrently
+on the server's handler threads; code that needs the state of the review
+it is part of calls current_run(), and work handed to other threads is
+wrapped with bind_run() to carry it along.
+
+The socket lives in a directory only the daemon's user can enter and is
+created owner-only. Jobs carry the client's LLM_* settings; those the
+daemon cannot change per job must match its own or the job is rejected,
+and the client then runs the review itself.
+"""
+
+import contextvars
+import io
+import json
+import os
+import select
+import socket
+import socketserver
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, Optional
+
+
+def default_socket_path() -> str:
+    """
+    Per-user socket location in a directory of our own under /tmp. It does
+    not depend on the session environment ($XDG_RUNTIME_DIR, $TMPDIR), so a
+    daemon started from a login shell and a client on a build agent agree.
+    """
+    return os.path.join("/tmp", f"llm-review-{os.getuid()}", "llm-review.sock")
+
+
+# Unix socket the review daemon listens on. Only the user running the
+# daemon may connect; the client checks the socket belongs to that user.
+LLM_REVIEW_SOCKET = os.environ.get("LLM_REVIEW_SOCKET") or default_socket_path()
+
+# Job environment variables the daemon applies per job. The client also
+# forwards every other LLM_* variable; the daemon read those once at start,
+# so a job whose values differ is rejected and the client runs it directly.
+FORWARDED_ENV = ("BRANCH_NAME", "GIT_BRANCH", "LLM_DEADLINE_SECONDS")
+
+# LLM_* variables that only configure the client
+CLIENT_ENV = ("LLM_REVIEW_SOCKET", "LLM_REVIEW_TIMEOUT")
+
+
+# ---------------------------------------------------------------------------
+# Run state
+# ---------------------------------------------------------------------------
+
+class RunState:
+    """
+    Per-review state. The daemon runs several reviews at once, each in its
+    own context (see run_job); a direct run uses one default RunState.
+    """
+
+    def __init__(
+        self,
+        cwd: Optional[str] = None,
+        env: Optional[Dict[str, str]] = None,
+        submitted: Optional[float] = None,
+    ):
+        # Repository the review runs in (None: the current directory)
+        self.cwd = cwd
+        # Job environment for per-job settings (None: os.environ)
+        self.env = env
+        # time.time() at which the client submitted the job, if queued
+        self.submitted = submitted
+        # Where print() output of the run goes in the daemon
+        self.log: Optional[io.StringIO] = None
+        self.stats: Counter = Counter()
+        self.cancelled = threading.Event()
+        # time.monotonic() by which the run must finish, if it has a budget
+        self.deadline: Optional[float] = None
+        # Circuit breaker of the run, set up when the review starts
+        self.breaker = None
+        # Session counters at the start of the run (the session outlives it)
+        self.session_baseline = (0, 0)
+        self.finding_cache = None
+        # Set when the daemon's client gave up on the job: stop, write nothing
+        self.abandoned = threading.Event()
+
+
+_RUN: "contextvars.ContextVar[RunState]" = contextvars.ContextVar("llm_review_run")
+_DEFAULT_RUN = RunState()
+
+
+def current_run() -> RunState:
+    """State of the review the calling code is part of."""
+    return _RUN.get(_DEFAULT_RUN)
+
+
+def run_env(name: str, default: str = "") -> str:
+    """A per-job environment variable: the job's value in the daemon."""
+    env = current_run().env
+    return (os.environ if env is None else env).get(name, default)
+
+
+def bind_run(fn: Callable) -> Callable:
+    """Wrap fn to run as part of the caller's review on another thread."""
+    run = current_run()
+
+    def bound(*args, **kwargs):
+        token = _RUN.set(run)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _RUN.reset(token)
+
+    return bound
+
+
+# ---------------------------------------------------------------------------
+# Daemon
+# ---------------------------------------------------------------------------
+
+# Runs one review: (changed_files.txt, output.md) -> exit code
+Review = Callable[[str, str], int]
+
+
+def _daemon_config(env: Dict[str, str]) -> Dict[str, str]:
+    """The LLM_* settings in env that are fixed for the daemon's lifetime."""
+    return {
+        k: v for k, v in env.items()
+        if k.startswith("LLM_") and k not in FORWARDED_ENV and k not in CLIENT_ENV
+    }
+
+
+def config_mismatch(env: Dict[str, str]) -> Optional[str]:
+    """Why a job's environment does not match the daemon's settings, if it does not."""
+    ours = _daemon_config(dict(os.environ))
+    theirs = _daemon_config(env)
+    differing = sorted(k for k in set(ours) | set(theirs) if ours.get(k) != theirs.get(k))
+    if not differing:
+        return None
+    return "job settings differ from the daemon's: " + ", ".join(differing)
+
+
+class _RunOutput:
+    """
+    sys.stdout of the daemon: print() output of a review goes to the log of
+    the job it belongs to, everything else to the daemon's own stdout.
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def write(self, text: str) -> int:
+        log = current_run().log
+        return (self._stream if log is None else log).write(text)
+
+    def flush(self) -> None:
+        self._stream.flush()
+
+
+def _watch_client(connection: socket.socket, run: RunState, finished: threading.Event) -> None:
+    """
+    Abandon run once its client hangs up (it timed out or was killed):
+    the deadline is moved to now, so the review stops like at a deadline.
+    """
+    while not finished.is_set():
+        try:
+            readable, _, _ = select.select([connection], [], [], 1.0)
+            if not readable:
+                continue
+            if connection.recv(1, socket.MSG_PEEK):
+                # Unexpected data rather than a hang-up; stop watching
+                return
+        except (OSError, ValueError):
+            pass
+        run.abandoned.set()
+        run.deadline = time.monotonic()
+        return
+
+
+def run_job(job: Dict, review: Review, connection: Optional[socket.socket] = None) -> Dict:
+    """
+    Run one review job submitted by llm_review_client.py. Each job runs in
+    its own RunState on the handler's thread, with git pointed at the job's
+    repository, so jobs from several builds proceed concurrently. With the
+    client's connection, the job is abandoned if the client goes away.
+    """
+    env = job.get("env", {})
+    mismatch = config_mismatch(env)
+    if mismatch:
+        return {"rejected": mismatch}
+    submitted = job.get("submitted")
+    run = RunState(
+        job["cwd"],
+        {k: v for k, v in env.items() if k in FORWARDED_ENV},
+        float(submitted) if submitted is not None else None,
+    )
+    run.log = io.StringIO()
+    finished = threading.Event()
+    if connection is not None:
+        threading.Thread(target=_watch_client, args=(connection, run, finished), daemon=True).start()
+    token = _RUN.set(run)
+    try:
+        code = review(job["changed_files"], job["output"])
+    except Exception as ex:
+        print(f"Review failed: {type(ex).__name__}: {ex}")
+        code = 1
+    finally:
+        finished.set()
+        _RUN.reset(token)
+    return {"exit_code": code, "log": run.log.getvalue()}
+
+
+class _JobServer(socketserver.ThreadingUnixStreamServer):
+    """Unix socket server that hands each job to `review`."""
+
+    def __init__(self, socket_path: str, review: Review):
+        self.review = review
+        super().__init__(socket_path, _JobHandler)
+
+
+class _JobHandler(socketserver.StreamRequestHandler):
+    """Reads one JSON job line and answers with one JSON result line."""
+
+    def handle(self) -> None:
+        try:
+            job = json.loads(self.rfile.readline())
+            result = run_job(job, self.server.review, self.connection)
+        except (ValueError, KeyError, TypeError) as ex:
+            result = {"exit_code": 2, "log": f"Invalid review job: {ex}\n"}
+        try:
+            self.wfile.write((json.dumps(result) + "\n").encode("utf-8"))
+        except OSError:
+            # The client is gone (timed out, or a probe that only connected)
+            pass
+
+
+def _daemon_running(socket_path: str) -> bool:
+    """Whether something already answers on socket_path."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        probe.settimeout(2)
+        try:
+            probe.connect(socket_path)
+        except OSError:
+            return False
+    return True
+
+
+def serve(
+    review: Review,
+    socket_path: str = LLM_REVIEW_SOCKET,
+    warm_up: Optional[Callable[[], object]] = None,
+) -> None:
+    """
+    Run the review daemon on a Unix socket until interrupted, calling
+    warm_up() once before accepting jobs.
+    """
+    directory = os.path.dirname(os.path.abspath(socket_path))
+    if socket_path == default_socket_path():
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        info = os.stat(directory)
+        if info.st_uid != os.getuid() or info.st_mode & 0o077:
+            print(f"Refusing to serve: {directory} is not private to this user")
+            sys.exit(1)
+
+    if os.path.exists(socket_path):
+        if _daemon_running(socket_path):
+            print(f"Refusing to serve: a review daemon already answers on {socket_path}")
+            sys.exit(1)
+        # Left behind by a daemon that did not shut down cleanly
+        os.unlink(socket_path)
+
+    if warm_up is not None:
+        warm_up()
+    sys.stdout = _RunOutput(sys.stdout)
+    # Owner-only from the moment it is bound, not just after a chmod
+    umask = os.umask(0o177)
+    try:
+        server = _JobServer(socket_path, review)
+    finally:
+        os.umask(umask)
+    os.chmod(socket_path, 0o600)
+    with server:
+        print(f"LLM review daemon listening on {socket_path}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.unlink(socket_path)
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Risk ranking of files from git history, used to decide which changes are
+reviewed first when the time or token budget cannot cover all of them.
+
+RiskScorer mines `git log --numstat` of a reference (origin/main) for four
+signals per file: churn (lines added + deleted), number of distinct
+authors, recency (commits weighted by an exponential decay on their age)
+and HIGH severity findings from earlier reviews of the repository, which
+the caller collects. Each signal is log-scaled against its largest value
+in the repository and the weighted sum gives a score between 0 and 1.
+
+Mining history and collecting findings are the expensive parts, so the
+per-file features and finding counts are cached as JSON per repository and
+reference SHA; a new origin/main commit invalidates them. The aggregation
+is vectorised with NumPy when it is installed and falls back to plain
+Python otherwise.
+
+Usage (print the riskiest files):
+    risk.py [ref] [count]
+"""
+
+import math
+import os
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # optional: the pure-Python path gives the same scores
+    np = None
+
+from review_cache import atomic_write_json, content_key, read_json
+
+# Relative weight of each signal in the score (they sum to 1)
+WEIGHTS = {"churn": 0.3, "authors": 0.2, "recency": 0.3, "high": 0.2}
+
+# Per-file history features: churn, commits, authors, recency
+Features = Dict[str, Tuple[float, int, int, float]]
+
+# One numstat line of a commit: (path, commit time, author, lines changed)
+_Change = Tuple[str, int, str, int]
+
+
+def _git(*args: str, cwd: Optional[str] = None) -> str:
+    return subprocess.run(
+        ["git", *args],
+        capture_output=True,
+        text=True,
+        check=True,
+        errors="replace",
+        cwd=cwd,
+    ).stdout
+
+
+def parse_numstat(log: str) -> List[_Change]:
+    """
+    Parse `git log --numstat --format=%x00%at %ae` output into one change
+    record per file per commit. Binary files count as one changed line.
+    """
+    changes: List[_Change] = []
+    when = 0
+    author = ""
+    for line in log.splitlines():
+        if line.startswith("\0"):
+            stamp, _, author = line[1:].partition(" ")
+            when = int(stamp or 0)
+            continue
+        parts = line.split("\t", 2)
+        if len(parts) != 3:
+            continue
+        added, deleted, path = parts
+        lines = (int(added) if added.isdigit() else 1) + (int(deleted) if deleted.isdigit() else 0)
+        changes.append((path, when, author, lines))
+    return changes
+
+
+def _aggregate_numpy(changes: List[_Change], now: float, half_life_days: float) -> Features:
+    # Interning strings through dicts is much faster than np.unique on objects
+    path_ids: Dict[str, int] = {}
+    author_ids: Dict[str, int] = {}
+    count = len(changes)
+    path_idx = np.fromiter((path_ids.setdefault(c[0], len(path_ids)) for c in changes), np.int64, count)
+    author_idx = np.fromiter((author_ids.setdefault(c[2], len(author_ids)) for c in changes), np.int64, count)
+    when = np.fromiter((c[1] for c in changes), np.float64, count)
+    lines = np.fromiter((c[3] for c in changes), np.float64, count)
+    n = len(path_ids)
+
+    churn = np.bincount(path_idx, weights=lines, minlength=n)
+    commits = np.bincount(path_idx, minlength=n)
+    pairs = np.unique(path_idx * len(author_ids) + author_idx)
+    authors = np.bincount(pairs // len(author_ids), minlength=n)
+    age_days = np.maximum(0.0, now - when) / 86400.0
+    recency = np.bincount(path_idx, weights=np.exp2(-age_days / half_life_days), minlength=n)
+
+    return {
+        p: (float(churn[i]), int(commits[i]), int(authors[i]), float(recency[i]))
+        for p, i in path_ids.items()
+    }
+
+
+def _aggregate_python(changes: List[_Change], now: float, half_life_days: float) -> Features:
+    churn: Dict[str, float] = {}
+    commits: Dict[str, int] = {}
+    authors: Dict[str, set] = {}
+    recency: Dict[str, float] = {}
+    for path, when, author, lines in changes:
+        churn[path] = churn.get(path, 0.0) + lines
+        commits[path] = commits.get(path, 0) + 1
+        authors.setdefault(path, set()).add(author)
+        age_days = max(0.0, now - when) / 86400.0
+        recency[path] = recency.get(path, 0.0) + 2 ** (-age_days / half_life_days)
+    return {p: (churn[p], commits[p], len(authors[p]), recency[p]) for p in churn}
+
+
+def aggregate(changes: List[_Change], now: Optional[float] = None, half_life_days: float = 90.0) -> Features:
+    """Per-file history features from change records (NumPy when available)."""
+    if not changes:
+        return {}
+    now = time.time() if now is None else now
+    if np is not None:
+        return _aggregate_numpy(changes, now, half_life_days)
+    return _aggregate_python(changes, now, half_life_days)
+
+
+class RiskScorer:
+    """
+    Scores files by history risk relative to the rest of the repository.
+    History features are mined once per `ref` SHA and cached in cache_dir,
+    keyed by `repo` (e.g. the origin URL) as well.
+    """
+
+    def __init__(
+        self,
+        ref: str = "origin/main",
+        cache_dir: str = "",
+        max_commits: int = 20000,
+        half_life_days: float = 90.0,
+        repo: str = "",
+        cwd: Optional[str] = None,
+    ):
+        self.ref = ref
+        self.cache_dir = cache_dir
+        self.max_commits = max_commits
+        self.half_life_days = half_life_days
+        self.repo = repo
+        # Repository to mine (None: the current directory)
+        self.cwd = cwd
+        self._features: Optional[Features] = None
+        self._high: Optional[Dict[str, int]] = None
+        self._high_stamp = ""
+        self._path = ""
+
+    def _cache_path(self, sha: str) -> str:
+        # "unquoted": entries mined before paths were unquoted are not reused
+        key = content_key("risk", "unquoted", self.repo, sha, self.max_commits, self.half_life_days)
+        return os.path.join(self.cache_dir, "risk", key + ".json")
+
+    def _save(self) -> None:
+        if not self._path:
+            return
+        entry = {"features": self._features, "high": self._high, "high_stamp": self._high_stamp}
+        try:
+            atomic_write_json(self._path, entry)
+        except OSError:
+            pass
+
+    def features(self) -> Features:
+        """History features of every file touched under ref (cached per SHA)."""
+        if self._features is not None:
+            return self._features
+        try:
+            sha = _git("rev-parse", "--verify", "--quiet", self.ref + "^{commit}", cwd=self.cwd).strip()
+        except (subprocess.CalledProcessError, OSError):
+            self._features = {}
+            return self._features
+
+        self._path = self._cache_path(sha) if self.cache_dir else ""
+        cached = read_json(self._path) if self._path else None
+        if isinstance(cached, dict) and isinstance(cached.get("features"), dict):
+            self._features = {p: tuple(v) for p, v in cached["features"].items()}
+            if isinstance(cached.get("high"), dict):
+                self._high = cached["high"]
+                self._high_stamp = str(cached.get("high_stamp", ""))
+            return self._features
+
+        try:
+            # Unquoted paths, as in changed_files.txt and the review's diffs
+            log = _git(
+                "-c", "core.quotePath=false",
+                "log", "--numstat", "--no-renames", "--format=%x00%at %ae",
+                f"--max-count={self.max_commits}", sha, cwd=self.cwd,
+            )
+        except (subprocess.CalledProcessError, OSError):
+            log = ""
+        self._features = aggregate(parse_numstat(log), half_life_days=self.half_life_days)
+        self._save()
+        return self._features
+
+    def past_high(self, collect: Callable[[], Dict[str, int]], stamp: str = "") -> Dict[str, int]:
+        """
+        HIGH findings per file from collect(), cached with the history
+        features. It is called again only when `ref` moves or `stamp`
+        (a version of the finding sources) changes.
+        """
+        self.features()
+        if self._high is None or self._high_stamp != stamp:
+            self._high = collect()
+            self._high_stamp = stamp
+            self._save()
+        return self._high
+
+    def scores(self, paths: List[str], past_high: Optional[Dict[str, int]] = None) -> Dict[str, float]:
+        """Risk between 0 and 1 for each path; files with no history score low."""
+        features = self.features()
+        past_high = past_high or {}
+        maxima = [max((f[i] for f in features.values()), default=0) for i in (0, 2, 3)]
+        max_high = max(past_high.values(), default=0)
+
+        def scaled(value: float, top: float) -> float:
+            return math.log1p(value) / math.log1p(top) if top > 0 else 0.0
+
+        result: Dict[str, float] = {}
+        for path in paths:
+            churn, _commits, authors, recency = features.get(path, (0.0, 0, 0, 0.0))
+            result[path] = (
+                WEIGHTS["churn"] * scaled(churn, maxima[0])
+                + WEIGHTS["authors"] * scaled(authors, maxima[1])
+                + WEIGHTS["recency"] * scaled(recency, maxima[2])
+                + WEIGHTS["high"] * scaled(past_high.get(path, 0), max_high)
+            )
+        return result
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = sys.argv[1:] if argv is None else argv
+    ref = args[0] if args else "origin/main"
+    count = int(args[1]) if len(args) > 1 else 20
+    scorer = RiskScorer(ref)
+    started = time.perf_counter()
+    features = scorer.features()
+    scores = scorer.scores(list(features))
+    elapsed = time.perf_counter() - started
+    print(f"{len(features)} files scored in {elapsed:.2f}s ({'numpy' if np is not None else 'pure Python'})")
+    for path, score in sorted(scores.items(), key=lambda item: -item[1])[:count]:
+        print(f"{score:.3f}  {path}")
+
+
+if __name__ == "__main__":
+    main()
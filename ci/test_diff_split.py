@@ -0,0 +1,162 @@
+"""
+Tests for diff_split: window sizes, applicability of every window and
+brace counting around literals and comments.
+
+Run from the ci directory:
+    python -m unittest test_diff_split
+"""
+
+import os
+import subprocess
+import tempfile
+import unittest
+from typing import List
+
+from diff_split import _member_boundaries, split_file_diff
+from tokens import approx_count
+
+BUDGET = 1500
+
+
+def controller(methods: int, changed: bool, noise: bool = False) -> str:
+    """Source of a C# controller; `changed` edits every method body."""
+    lines = ["namespace Api.Controllers", "{", "    public class BigController : ControllerBase", "    {"]
+    for i in range(methods):
+        lines += [
+            f'        [HttpGet("items/{{id}}/{i}")]',
+            f"        public async Task<IActionResult> Get{i}(int id, CancellationToken ct)",
+            "        {",
+        ]
+        if noise:
+            lines += [
+                "            /* legacy: if (item.Stale) {",
+                "               return Conflict(); { */",
+                '            var marker = "{ not a brace";',
+                "            // a } in a comment",
+            ]
+        lines += [
+            f"            var item = await _db.Items.FindAsync(new object[] {{ id + {i} }}, ct);",
+            "            if (item == null)",
+            "            {",
+            "                return NotFound(new { id });" if changed else "                return NotFound();",
+            "            }",
+            "            return Ok(item);",
+            "        }",
+            "",
+        ]
+    lines += ["    }", "}"]
+    return "\n".join(lines) + "\n"
+
+
+class SplitFileDiffTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self._tmp = tempfile.TemporaryDirectory()
+        self.dir = self._tmp.name
+
+    def tearDown(self) -> None:
+        self._tmp.cleanup()
+
+    def write(self, name: str, text: str) -> None:
+        with open(os.path.join(self.dir, name), "w") as f:
+            f.write(text)
+
+    def modified_diff(self, methods: int, noise: bool = False) -> str:
+        """One large hunk changing every method of Big.cs."""
+        os.makedirs(os.path.join(self.dir, "a"), exist_ok=True)
+        os.makedirs(os.path.join(self.dir, "b"), exist_ok=True)
+        self.write("a/Big.cs", controller(methods, False, noise))
+        self.write("b/Big.cs", controller(methods, True, noise))
+        return subprocess.run(
+            ["git", "diff", "--no-index", "-U100000", "a/Big.cs", "b/Big.cs"],
+            cwd=self.dir,
+            capture_output=True,
+            text=True,
+        ).stdout
+
+    def assert_applies(self, windows: List[str], base: str) -> None:
+        for number, window in enumerate(windows):
+            result = subprocess.run(
+                ["git", "apply", "--check", "-p2", "-"],
+                cwd=os.path.join(self.dir, base),
+                input=window,
+                capture_output=True,
+                text=True,
+            )
+            self.assertEqual(result.returncode, 0, f"window {number}: {result.stderr}")
+
+    def test_small_diff_is_unchanged(self) -> None:
+        diff = self.modified_diff(3)
+        self.assertEqual(split_file_diff(diff, BUDGET, approx_count), [diff])
+
+    def test_windows_fit_the_budget(self) -> None:
+        diff = self.modified_diff(150)
+        windows = split_file_diff(diff, BUDGET, approx_count)
+        self.assertGreater(len(windows), 1)
+        for window in windows:
+            self.assertLessEqual(approx_count(window), BUDGET)
+
+    def test_windows_cover_every_change(self) -> None:
+        diff = self.modified_diff(150)
+        windows = split_file_diff(diff, BUDGET, approx_count)
+        changed = [line for line in diff.splitlines() if line.startswith(("+    ", "-    "))]
+        seen = set(line for window in windows for line in window.splitlines())
+        self.assertTrue(all(line in seen for line in changed))
+
+    def test_every_window_applies(self) -> None:
+        windows = split_file_diff(self.modified_diff(150), BUDGET, approx_count)
+        self.assert_applies(windows, "a")
+
+    def test_new_file_windows_apply(self) -> None:
+        os.makedirs(os.path.join(self.dir, "a"))
+        self.write("new.cs", controller(150, True))
+        diff = subprocess.run(
+            ["git", "diff", "--no-index", "/dev/null", "new.cs"],
+            cwd=self.dir,
+            capture_output=True,
+            text=True,
+        ).stdout
+        windows = split_file_diff(diff, BUDGET, approx_count)
+        self.assertGreater(len(windows), 1)
+        for window in windows:
+            self.assertLessEqual(approx_count(window), BUDGET)
+        os.remove(os.path.join(self.dir, "new.cs"))
+        for number, window in enumerate(windows):
+            result = subprocess.run(
+                ["git", "apply", "--check", "-"],
+                cwd=self.dir,
+                input=window,
+                capture_output=True,
+                text=True,
+            )
+            self.assertEqual(result.returncode, 0, f"window {number}: {result.stderr}")
+
+    def test_braces_in_comments_and_strings_are_ignored(self) -> None:
+        body = [
+            "+class A",
+            "+{",
+            "+    /* if (x) {",
+            "+       { still a comment */",
+            '+    var s = "{";',
+            "+    var c = '{';",
+            "+    // }",
+            "+    void M() { }",
+            "+}",
+        ]
+        cuts, depths = _member_boundaries(body)
+        self.assertEqual(depths, [0, 1, 1, 1, 1, 1, 1, 1, 0])
+        self.assertFalse(cuts[2])
+        self.assertTrue(cuts[4])
+
+    def test_comment_braces_do_not_fragment_windows(self) -> None:
+        plain = split_file_diff(self.modified_diff(150), BUDGET, approx_count)
+        noisy = split_file_diff(self.modified_diff(150, noise=True), BUDGET, approx_count)
+        # The noisy controller is about 1.4x the size; cutting early at
+        # spurious depth changes would need far more windows than that
+        self.assertLess(len(noisy), len(plain) * 1.6)
+        for window in noisy[:-1]:
+            self.assertGreater(approx_count(window), BUDGET * 0.7)
+        self.assert_applies(noisy, "a")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,281 @@
+"""
+Tests for the pure helpers of llm_review: splitting a multi-file diff,
+parsing and merging findings, packing file diffs into chunks and carrying
+findings forward between incremental reviews.
+
+Run from the ci directory:
+    python -m unittest test_llm_review
+"""
+
+import os
+import subprocess
+import tempfile
+import unittest
+from typing import List
+from unittest import mock
+
+import llm_review
+from llm_review import (
+    DEADLINE_NOTE,
+    NO_ISSUES_TEXT,
+    TRUNCATED_NOTE,
+    Finding,
+    carried_forward,
+    chunk_file_diffs,
+    dedupe_findings,
+    estimate_tokens,
+    format_file_diff,
+    merge_reviews,
+    parse_findings,
+    split_diff_by_file,
+)
+from review_daemon import _RUN, RunState
+
+
+def finding(severity: str, title: str, path: str) -> str:
+    return (
+        f"- [SEVERITY: {severity}] {title}\n"
+        f"  - File: {path}\n"
+        f"  - Description: {title.lower()}\n"
+        f"  - Suggestion: fix it\n"
+    )
+
+
+def file_diff(path: str, lines: int) -> str:
+    body = "".join(f"+        var value{i} = Compute({i});\n" for i in range(lines))
+    return (
+        f"diff --git a/{path} b/{path}\n"
+        f"--- a/{path}\n"
+        f"+++ b/{path}\n"
+        f"@@ -0,0 +1,{lines} @@\n" + body
+    )
+
+
+class SplitDiffByFileTest(unittest.TestCase):
+    def test_sections_are_keyed_by_path(self) -> None:
+        a = file_diff("Api/A.cs", 2)
+        b = file_diff("Api/B.cs", 3)
+        sections = split_diff_by_file(a + b, ["Api/A.cs", "Api/B.cs"])
+        self.assertEqual(sections, {"Api/A.cs": a, "Api/B.cs": b})
+
+    def test_renames_match_on_the_new_path(self) -> None:
+        diff = (
+            "diff --git a/Api/Old.cs b/Api/New.cs\n"
+            "similarity index 90%\n"
+            "rename from Api/Old.cs\n"
+            "rename to Api/New.cs\n"
+        )
+        self.assertEqual(split_diff_by_file(diff, ["Api/New.cs"]), {"Api/New.cs": diff})
+
+    def test_unrequested_files_are_dropped(self) -> None:
+        a = file_diff("Api/A.cs", 2)
+        sections = split_diff_by_file(a + file_diff("Api/B.cs", 3), ["Api/A.cs"])
+        self.assertEqual(sections, {"Api/A.cs": a})
+
+
+class FindingsTest(unittest.TestCase):
+    def test_parse_findings(self) -> None:
+        text = (
+            "Some preamble.\n"
+            + finding("HIGH", "SQL injection", "Api/Repo.cs")
+            + finding("LOW", "Naming", "Api/A.cs")
+            + "Overall the change looks fine.\n"
+        )
+        findings = parse_findings(text)
+        self.assertEqual([(f.severity, f.title, f.file) for f in findings], [
+            ("HIGH", "SQL injection", "Api/Repo.cs"),
+            ("LOW", "Naming", "Api/A.cs"),
+        ])
+        # Unindented prose ends the last finding's details
+        self.assertNotIn("Overall", findings[1].details)
+
+    def test_dedupe_drops_repeats_and_orders_by_severity(self) -> None:
+        findings = parse_findings(
+            finding("LOW", "Naming", "Api/A.cs")
+            + finding("HIGH", "SQL injection", "Api/Repo.cs")
+            + finding("LOW", "naming", "Api/A.cs")
+            + finding("LOW", "Naming", "Api/B.cs")
+        )
+        result = dedupe_findings(findings)
+        self.assertEqual([(f.severity, f.file) for f in result], [
+            ("HIGH", "Api/Repo.cs"),
+            ("LOW", "Api/A.cs"),
+            ("LOW", "Api/B.cs"),
+        ])
+
+    def test_merge_reviews(self) -> None:
+        chunks = [[("Api/A.cs", "")], [("Api/B.cs", "")], [("Api/C.cs", "")]]
+        reviews = [
+            finding("LOW", "Naming", "Api/A.cs"),
+            finding("HIGH", "SQL injection", "Api/B.cs") + finding("LOW", "Naming", "Api/A.cs"),
+            "The model rambled without findings.",
+        ]
+        merged = merge_reviews(chunks, reviews)
+        self.assertEqual(merged.count("[SEVERITY: LOW] Naming"), 1)
+        self.assertLess(merged.index("HIGH"), merged.index("LOW"))
+        # Output without findings or a "no issues" verdict is kept verbatim
+        self.assertIn("### Part 3 (Api/C.cs)\n\nThe model rambled", merged)
+
+    def test_merge_reviews_of_clean_parts(self) -> None:
+        merged = merge_reviews([[("Api/A.cs", "")], [("Api/B.cs", "")]], [NO_ISSUES_TEXT, NO_ISSUES_TEXT])
+        self.assertIn(NO_ISSUES_TEXT, merged)
+        self.assertNotIn("Unmerged output", merged)
+
+    def test_merge_reviews_skips_stopped_parts(self) -> None:
+        chunks = [[("Api/A.cs", "")], [("Api/B.cs", "")], [("Api/C.cs", "")]]
+        cut_off = finding("HIGH", "SQL injection", "Api/B.cs") + "- [SEVERITY: LOW] Na\n\n" + TRUNCATED_NOTE
+        merged = merge_reviews(chunks, [DEADLINE_NOTE, cut_off, TRUNCATED_NOTE])
+        # Complete findings of a cut-off part count; its remains are not kept
+        self.assertIn("[SEVERITY: HIGH] SQL injection", merged)
+        self.assertNotIn("Unmerged output", merged)
+        self.assertNotIn(NO_ISSUES_TEXT, merged)
+
+
+class ChunkFileDiffsTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self._tmp = tempfile.TemporaryDirectory()
+        root = self._tmp.name
+        for project in ("Api", "Worker"):
+            os.makedirs(os.path.join(root, project, "Controllers"))
+            open(os.path.join(root, project, f"{project}.csproj"), "w").close()
+        self._token = _RUN.set(RunState(cwd=root))
+
+    def tearDown(self) -> None:
+        _RUN.reset(self._token)
+        self._tmp.cleanup()
+
+    def cost(self, path: str, diff: str) -> int:
+        return estimate_tokens(format_file_diff(path, diff))
+
+    def test_every_file_is_packed_once_within_budget(self) -> None:
+        file_diffs = [(f"Api/Controllers/C{i}.cs", file_diff(f"Api/Controllers/C{i}.cs", 5 + 7 * i)) for i in range(12)]
+        budget = 2000
+        chunks = chunk_file_diffs(file_diffs, budget)
+        packed = [item for chunk in chunks for item in chunk]
+        self.assertEqual(sorted(packed), sorted(file_diffs))
+        for chunk in chunks:
+            self.assertLessEqual(sum(self.cost(p, d) for p, d in chunk), budget)
+            # Files keep their changed_files.txt order within a chunk
+            self.assertEqual(chunk, sorted(chunk, key=file_diffs.index))
+        # Best-fit decreasing needs no more than one chunk over the bound
+        total = sum(self.cost(p, d) for p, d in file_diffs)
+        self.assertLessEqual(len(chunks), total // budget + 2)
+
+    def test_project_files_are_kept_together(self) -> None:
+        paths = ["Api/Controllers/A.cs", "Worker/Controllers/W.cs", "Api/Startup.cs", "Worker/Program.cs"]
+        file_diffs = [(p, file_diff(p, 10)) for p in paths]
+        budget = 2 * max(self.cost(p, d) for p, d in file_diffs) + 10
+        chunks = chunk_file_diffs(file_diffs, budget)
+        projects = [{p.split("/")[0] for p, _ in chunk} for chunk in chunks]
+        self.assertEqual(sorted(map(sorted, projects)), [["Api"], ["Worker"]])
+
+    def test_oversized_file_gets_its_own_chunk(self) -> None:
+        big = ("Api/Big.cs", file_diff("Api/Big.cs", 400))
+        small = ("Api/Small.cs", file_diff("Api/Small.cs", 3))
+        chunks = chunk_file_diffs([small, big], self.cost(*big) // 2)
+        self.assertIn([big], chunks)
+        self.assertIn([small], chunks)
+
+
+class CarriedForwardTest(unittest.TestCase):
+    def findings(self) -> List[Finding]:
+        return parse_findings(
+            finding("HIGH", "SQL injection", "Api/Repo.cs")
+            + finding("LOW", "Naming", "src/Api/Controllers/A.cs")
+            + finding("MEDIUM", "Leak", "Api/B.cs")
+        )
+
+    def test_findings_on_untouched_files_are_kept(self) -> None:
+        kept = carried_forward(self.findings(), ["Api/Other.cs"], [])
+        self.assertEqual(len(kept), 3)
+
+    def test_findings_on_rereviewed_files_are_superseded(self) -> None:
+        kept = carried_forward(self.findings(), ["Api/Repo.cs", "Api/Controllers/A.cs"], [])
+        self.assertEqual([f.file for f in kept], ["Api/B.cs"])
+
+    def test_findings_on_unreviewed_files_are_kept(self) -> None:
+        kept = carried_forward(self.findings(), ["Api/Repo.cs", "Api/B.cs"], ["Api/Repo.cs"])
+        self.assertEqual([f.file for f in kept], ["Api/Repo.cs", "src/Api/Controllers/A.cs"])
+
+
+class IncrementalReviewTest(unittest.TestCase):
+    """run_review over two pushes of a branch, with the LLM call stubbed."""
+
+    def setUp(self) -> None:
+        self._tmp = tempfile.TemporaryDirectory()
+        self.repo = os.path.join(self._tmp.name, "repo")
+        os.makedirs(self.repo)
+        self.git("init", "-q", "-b", "main")
+        self.write_lines({})
+        self.git("add", "Foo.cs")
+        self.commit("init")
+        self.git("update-ref", "refs/remotes/origin/main", "HEAD")
+        self.git("checkout", "-q", "-b", "feature")
+
+        self._token = _RUN.set(RunState(cwd=self.repo, env={"BRANCH_NAME": "feature"}))
+        patches = {
+            "LLM_INCREMENTAL": True,
+            "LLM_STATE_DIR": os.path.join(self._tmp.name, "state"),
+            "LLM_CACHE_DIR": "",
+            "LLM_FINDING_CACHE": False,
+            "LLM_RISK": False,
+            "LLM_STREAM": False,
+            "call_llm": self.fake_llm,
+        }
+        self._patches = [mock.patch.object(llm_review, k, v) for k, v in patches.items()]
+        for patch in self._patches:
+            patch.start()
+
+    def tearDown(self) -> None:
+        for patch in self._patches:
+            patch.stop()
+        _RUN.reset(self._token)
+        self._tmp.cleanup()
+
+    def git(self, *args: str) -> None:
+        env = dict(os.environ, GIT_AUTHOR_NAME="t", GIT_AUTHOR_EMAIL="t@t",
+                   GIT_COMMITTER_NAME="t", GIT_COMMITTER_EMAIL="t@t")
+        subprocess.run(["git", *args], cwd=self.repo, env=env, check=True, capture_output=True)
+
+    def commit(self, message: str) -> None:
+        self.git("commit", "-q", "-am", message)
+
+    def write_lines(self, changes: dict) -> None:
+        lines = [changes.get(i, f"line{i};") for i in range(1, 301)]
+        with open(os.path.join(self.repo, "Foo.cs"), "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+    @staticmethod
+    def fake_llm(prompt: str, on_token=None, max_tokens=None, model=None) -> str:
+        if "+Bug();" in prompt:
+            return finding("HIGH", "Bug on line 10", "Foo.cs")
+        return NO_ISSUES_TEXT
+
+    def review(self) -> str:
+        changed = os.path.join(self._tmp.name, "changed_files.txt")
+        with open(changed, "w") as f:
+            f.write("Foo.cs\n")
+        output = os.path.join(self._tmp.name, "review.md")
+        with mock.patch("builtins.print"):
+            llm_review.run_review(changed, output)
+        with open(output) as f:
+            return f.read()
+
+    def test_finding_survives_a_push_elsewhere_in_the_file(self) -> None:
+        self.write_lines({10: "Bug();"})
+        self.commit("push 1")
+        self.assertIn("[SEVERITY: HIGH] Bug on line 10", self.review())
+
+        self.write_lines({10: "Bug();", 200: "line200x;"})
+        self.commit("push 2")
+        report = self.review()
+        self.assertIn("Incremental review", report)
+        self.assertIn("[SEVERITY: HIGH] Bug on line 10", report)
+
+        self.write_lines({200: "line200x;"})
+        self.commit("push 3")
+        self.assertNotIn("SEVERITY: HIGH", self.review())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+"""
+Token counting for LLM review prompts.
+
+TokenCounter uses the model's own tokenizer when a vocabulary file is on
+disk and the matching library is installed (a Hugging Face tokenizer.json
+via `tokenizers`, or a SentencePiece .model via `sentencepiece`). Otherwise
+it falls back to a fast approximation tuned for LLaMA-style tokenizers on
+source code. Counts are cached per text blob, since the same file diffs are
+measured repeatedly while chunks are packed.
+"""
+
+import hashlib
+import math
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+
+# Letter runs, single digits (LLaMA splits numbers into digits), single
+# punctuation characters, and whitespace runs that contain a line break.
+_APPROX_RE = re.compile(r"[A-Za-z]+|\d|[^\sA-Za-z\d]|\s*\n\s*")
+
+
+def approx_count(text: str) -> int:
+    """
+    Approximate LLaMA token count: about four letters per token for words,
+    one token per digit or punctuation character, and one per line break
+    plus one per four characters of indentation.
+    """
+    count = 0
+    for m in _APPROX_RE.finditer(text):
+        piece = m.group()
+        first = piece[0]
+        if first.isalpha():
+            count += math.ceil(len(piece) / 4)
+        elif first.isspace():
+            count += 1 + (len(piece) - 1) // 4
+        else:
+            count += 1
+    return count
+
+
+def _load_exact(path: str) -> Optional[Callable[[str], int]]:
+    """Load an exact token counter for a vocab file, if its library is present."""
+    if path.endswith(".json"):
+        try:
+            from tokenizers import Tokenizer
+        except ImportError:
+            return None
+        tokenizer = Tokenizer.from_file(path)
+        return lambda text: len(tokenizer.encode(text, add_special_tokens=False).ids)
+
+    if path.endswith(".model"):
+        try:
+            import sentencepiece
+        except ImportError:
+            return None
+        processor = sentencepiece.SentencePieceProcessor(model_file=path)
+        return lambda text: len(processor.encode(text))
+
+    return None
+
+
+class TokenCounter:
+    """
+    Counts tokens with the exact tokenizer when available, else approx_count.
+    Results are memoised per text blob in a bounded LRU.
+    """
+
+    def __init__(self, vocab_path: str = "", cache_size: int = 4096):
+        self.exact = False
+        self._count: Callable[[str], int] = approx_count
+        if vocab_path and os.path.exists(vocab_path):
+            try:
+                loaded = _load_exact(vocab_path)
+            except Exception as ex:
+                print(f"Could not load tokenizer {vocab_path}: {ex}; using approximate counts.")
+                loaded = None
+            if loaded is not None:
+                self._count = loaded
+                self.exact = True
+        self._cache: "OrderedDict[str, int]" = OrderedDict()
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+
+    def count(self, text: str) -> int:
+        """Number of tokens in text."""
+        key = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        n = self._count(text)
+
+        with self._lock:
+            self._cache[key] = n
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return n
+
+    def truncate(self, text: str, limit: int) -> str:
+        """
+        Longest prefix of text (cut at a line break where possible) that
+        fits in limit tokens.
+        """
+        if self.count(text) <= limit:
+            return text
+        lo, hi = 0, len(text)
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if self.count(text[:mid]) <= limit:
+                lo = mid
+            else:
+                hi = mid - 1
+        cut = text.rfind("\n", 0, lo)
+        return text[:cut + 1] if cut > 0 else text[:lo]